@@ -42,7 +42,7 @@ class FakeSession:
             raise AssertionError("No fake POST responses queued")
         return self._post_responses.pop(0)
 
-    def request(self, method: str, url: str, headers=None, params=None, json=None, timeout=None):  # noqa: D401
+    def request(self, method: str, url: str, headers=None, params=None, json=None, data=None, timeout=None):  # noqa: D401
         self.request_calls.append((method, url))
         if not self._request_responses:
             raise AssertionError("No fake request responses queued")
@@ -2,8 +2,19 @@ from __future__ import annotations
 
 import unittest
 import json
+from unittest.mock import patch
 
-from zen_backend.email.analyzer import analyze_email, get_user_categories, get_analysis, EmailAnalysis, EmailAnalysisError
+from flask import Flask
+
+from zen_backend.email.analysis_routes import analysis_bp
+from zen_backend.email.analyzer import (
+    analyze_email,
+    get_user_categories,
+    get_analysis,
+    EmailAnalysis,
+    EmailAnalysisError,
+    EmailAnalysisStoreError,
+)
 
 
 class FakeGeminiResponse:
@@ -214,5 +225,68 @@ class EmailAnalysisTests(unittest.TestCase):
         self.assertIn("GEMINI_API_KEY", str(exc))
 
 
+class HistoryStreamingTests(unittest.TestCase):
+    """Error behaviour of the streamed GET /email/analysis/history response."""
+
+    def setUp(self) -> None:
+        app = Flask(__name__)
+        app.config["TESTING"] = True
+        app.register_blueprint(analysis_bp)
+        self.client = app.test_client()
+        self.verify_patcher = patch("zen_backend.auth.utils.firebase_auth.verify_id_token")
+        self.mock_verify = self.verify_patcher.start()
+        self.mock_verify.return_value = {"uid": "user-123"}
+        self.headers = {"Authorization": "Bearer history-token"}
+
+    def tearDown(self) -> None:
+        self.verify_patcher.stop()
+
+    def test_history_streams_items(self) -> None:
+        def fake_iter(uid, *, limit):
+            yield {"id": f"{uid}_gmail_msg-1", "messageId": "msg-1", "importance": 5}
+            yield {"id": f"{uid}_gmail_msg-2", "messageId": "msg-2", "importance": 3}
+
+        with patch("zen_backend.email.analysis_routes.iter_analyses", fake_iter):
+            response = self.client.get("/email/analysis/history", headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        payload = json.loads(response.data)
+        self.assertNotIn("error", payload)
+        self.assertEqual(
+            [item["id"] for item in payload["items"]],
+            ["user-123_gmail_msg-1", "user-123_gmail_msg-2"],
+        )
+
+    def test_history_query_error_returns_error_response(self) -> None:
+        def fake_iter(uid, *, limit):
+            raise EmailAnalysisStoreError("query failed")
+            yield  # pragma: no cover - makes this a generator like the real one
+
+        with patch("zen_backend.email.analysis_routes.iter_analyses", fake_iter):
+            response = self.client.get("/email/analysis/history", headers=self.headers)
+
+        self.assertEqual(response.status_code, 500)
+        payload = json.loads(response.data)
+        self.assertEqual(payload["error"], "email_analysis_store_error")
+        self.assertNotIn("items", payload)
+
+    def test_history_mid_stream_error_closes_json_document(self) -> None:
+        def fake_iter(uid, *, limit):
+            yield {"id": f"{uid}_gmail_msg-1", "messageId": "msg-1", "importance": 5}
+            yield {"id": f"{uid}_gmail_msg-2", "messageId": "msg-2", "importance": 3}
+            raise EmailAnalysisStoreError("stream died")
+
+        with patch("zen_backend.email.analysis_routes.iter_analyses", fake_iter):
+            response = self.client.get("/email/analysis/history", headers=self.headers)
+
+        # The status line is already committed when the error hits, so the
+        # body must still be a complete JSON document that carries the error.
+        self.assertEqual(response.status_code, 200)
+        payload = json.loads(response.data)
+        self.assertEqual(len(payload["items"]), 2)
+        self.assertEqual(payload["error"], "email_analysis_store_error")
+        self.assertEqual(payload["message"], "stream died")
+
+
 if __name__ == "__main__":
     unittest.main()
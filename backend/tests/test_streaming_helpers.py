@@ -2,6 +2,14 @@ import json
 from types import SimpleNamespace
 
 from zen_backend.ai.ai_adapter import _extract_text_from_event, _sse_message
+from zen_backend.chats import routes as chat_routes
+from zen_backend.chats.routes import (
+    _SSE_COALESCE_CHARS,
+    _SSE_FLUSH_BYTES,
+    _TokenMerger,
+    _coalesce_sse,
+    _sse_token_frame,
+)
 
 
 def test_sse_message_format():
@@ -31,3 +39,85 @@ def test_extract_text_handles_candidate_parts():
     candidate = SimpleNamespace(content=content)
     event = SimpleNamespace(text=None, delta=None, candidates=[candidate])
     assert _extract_text_from_event(event) == "piece"
+
+
+def test_sse_token_frame_format():
+    result = _sse_token_frame('he said "hi"\nthen left')
+    assert result.startswith(b"data: ")
+    assert result.endswith(b"\n\n")
+    # JSON escaping means the frame body never contains a raw newline, so no
+    # data: continuation lines are needed.
+    assert b"\n" not in result[:-2]
+    payload = json.loads(result[6:-2])
+    assert payload == {"type": "token", "token": 'he said "hi"\nthen left'}
+
+
+def _fixed_clock(monkeypatch, start=0.0):
+    now = [start]
+    monkeypatch.setattr(chat_routes.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_merger_merges_until_char_threshold(monkeypatch):
+    _fixed_clock(monkeypatch)
+    merger = _TokenMerger()
+    assert merger.add("ab") is None
+    filler = "c" * (_SSE_COALESCE_CHARS - 3)
+    assert merger.add(filler) is None
+    assert merger.add("d") == "ab" + filler + "d"
+    assert merger.flush() is None
+
+
+def test_token_merger_flushes_on_age(monkeypatch):
+    now = _fixed_clock(monkeypatch)
+    merger = _TokenMerger()
+    assert merger.add("a") is None
+    now[0] += 0.05
+    assert merger.add("b") == "ab"
+
+
+def test_token_merger_flush_drains_tail(monkeypatch):
+    _fixed_clock(monkeypatch)
+    merger = _TokenMerger()
+    assert merger.add("tail") is None
+    assert merger.flush() == "tail"
+    assert merger.flush() is None
+
+
+def test_coalesce_sse_batches_tokens_until_non_token_frame(monkeypatch):
+    _fixed_clock(monkeypatch)
+    token_a = _sse_token_frame("a")
+    token_b = _sse_token_frame("b")
+    done = chat_routes._sse_message({"type": "done"})
+    out = list(_coalesce_sse(iter([token_a, token_b, done])))
+    # Buffered tokens and the non-token frame go out as one write.
+    assert out == [token_a + token_b + done]
+
+
+def test_coalesce_sse_flushes_on_size(monkeypatch):
+    _fixed_clock(monkeypatch)
+    big = _sse_token_frame("x" * _SSE_FLUSH_BYTES)
+    small = _sse_token_frame("y")
+    out = list(_coalesce_sse(iter([big, small])))
+    assert out == [big, small]
+
+
+def test_coalesce_sse_flushes_on_age(monkeypatch):
+    now = _fixed_clock(monkeypatch)
+    token_a = _sse_token_frame("a")
+    token_b = _sse_token_frame("b")
+
+    def frames():
+        yield token_a
+        now[0] += 0.05
+        yield token_b
+
+    out = list(_coalesce_sse(frames()))
+    assert out == [token_a + token_b]
+
+
+def test_coalesce_sse_passes_non_token_frames_through(monkeypatch):
+    _fixed_clock(monkeypatch)
+    error_frame = chat_routes._sse_message({"type": "error", "message": "boom"})
+    out = list(_coalesce_sse(iter([error_frame])))
+    assert out == [error_frame]
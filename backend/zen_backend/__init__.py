@@ -1,8 +1,40 @@
 from __future__ import annotations
 
+from datetime import datetime, timezone
+
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+import orjson
 import threading
 import time
+
+
+def _json_default(obj):
+    # orjson encodes exact datetime instances natively but refuses subclasses
+    # such as Firestore's DatetimeWithNanoseconds; match its RFC 3339 output.
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for faster encode/decode."""
+
+    def dumps(self, obj, **kwargs):
+        # OPT_NON_STR_KEYS keeps parity with stdlib json, which stringifies
+        # int dict keys instead of raising.
+        return orjson.dumps(
+            obj,
+            default=_json_default,
+            option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS,
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 _API_USAGE = {
     'minute_count': 0,
     'minute_reset_time': 0,
@@ -69,6 +101,7 @@ def create_app(config: AppConfig | None = None) -> Flask:
             raise RuntimeError(f"Configuration error: {exc}") from exc
 
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
 
     @app.before_request
     def api_overuse_guard():
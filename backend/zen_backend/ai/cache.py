@@ -0,0 +1,55 @@
+"""Exact-match response cache for LLM calls.
+
+Repeated prompts (title generation for similar openings, re-asked
+questions, converging tool iterations) otherwise pay a full upstream
+round-trip for an answer we already have. Keys are content hashes, so no
+prompt text is retained beyond the cached value itself.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from typing import Any, Callable
+
+import orjson
+
+_CACHE_MAX_ENTRIES = 1024
+_cache: dict[str, tuple[float, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+def make_key(payload: Any) -> str | None:
+    """Hash a JSON-serializable payload into a stable cache key.
+
+    Returns ``None`` when the payload cannot be serialized (e.g. contains
+    SDK objects); callers should then skip caching rather than fail.
+    """
+
+    try:
+        encoded = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        return None
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_or_set(key: str, fetch_fn: Callable[[], Any], ttl: float) -> Any:
+    """Return the cached value for ``key`` or compute and store it."""
+
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            expires, value = entry
+            if now < expires:
+                return value
+            del _cache[key]
+
+    value = fetch_fn()
+
+    with _cache_lock:
+        if len(_cache) >= _CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[key] = (now + ttl, value)
+    return value
@@ -8,16 +8,37 @@ from typing import Any, Sequence
 
 import requests
 
+from . import cache as llm_cache
+
+# Shared session for the model-list endpoint; keeps the connection warm.
+_HTTP = requests.Session()
+
 DEFAULT_MODEL = "z-ai/glm-4.5-air"  # Example, change to your preferred default
 
 log = logging.getLogger(__name__)
 
 MODEL_CACHE_TTL_SECONDS = 300
+# Reuse one OpenRouter client (and its pooled HTTP connections) per
+# credentials/server pair instead of paying a TLS handshake per call.
+_client_cache: dict[str, Any] = {}
+
+
+def _get_client(api_key: str, server_url: str | None = None) -> Any:
+    key = api_key if server_url is None else f"{api_key}|{server_url}"
+    client = _client_cache.get(key)
+    if client is None:
+        client = _client_cache[key] = openrouter.OpenRouter(api_key=api_key, server_url=server_url)
+    return client
+
+
 _MODEL_CACHE: dict[str, Any] = {
     "timestamp": 0.0,
     "models": [],
+    "ids": frozenset(),
+    "ids_sorted": (),
     "provider": None,
     "server_url": None,
+    "api_key": None,
 }
 
 class GeminiAPIError(RuntimeError):
@@ -52,7 +73,7 @@ def stream_reply(
 ) -> Any:
     """Open a streaming OpenRouter response for the provided conversation history."""
     try:
-        client = openrouter.OpenRouter(api_key=api_key, server_url=server_url)
+        client = _get_client(api_key, server_url)
         # OpenRouter expects messages as a list of dicts with 'role' and 'content'
         return client.chat.send(
             model=model,
@@ -90,6 +111,7 @@ def list_available_models(
         and cached_models
         and _MODEL_CACHE.get("provider") == provider
         and _MODEL_CACHE.get("server_url") == server_url
+        and _MODEL_CACHE.get("api_key") == api_key
         and now - float(_MODEL_CACHE.get("timestamp") or 0.0) < MODEL_CACHE_TTL_SECONDS
     ):
         return list(cached_models)
@@ -100,7 +122,7 @@ def list_available_models(
         headers["Authorization"] = f"Bearer {api_key}"
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _HTTP.get(url, headers=headers, timeout=10)
     except requests.RequestException as exc:
         raise GeminiAPIError(f"Failed to fetch models: {exc}") from exc
 
@@ -135,12 +157,41 @@ def list_available_models(
         {
             "timestamp": now,
             "models": models,
+            "ids": frozenset(model["id"] for model in models),
+            "ids_sorted": tuple(sorted(model["id"] for model in models)),
             "provider": provider,
             "server_url": server_url,
+            "api_key": api_key,
         }
     )
     return list(models)
 
+
+def list_available_model_ids(
+    *,
+    api_key: str | None,
+    provider: str,
+    server_url: str | None = None,
+) -> frozenset[str]:
+    """Return the set of available model ids for O(1) membership checks.
+
+    Reuses the cached frozenset built alongside the model list so validating
+    a requested model on the chat hot path costs a single lookup.
+    """
+    models = list_available_models(api_key=api_key, provider=provider, server_url=server_url)
+    if (
+        _MODEL_CACHE.get("ids")
+        and _MODEL_CACHE.get("provider") == provider
+        and _MODEL_CACHE.get("server_url") == server_url
+    ):
+        return _MODEL_CACHE["ids"]
+    return frozenset(model["id"] for model in models if model.get("id"))
+
+
+def sorted_model_ids() -> tuple[str, ...]:
+    """Sorted counterpart of the cached id set, for error payloads."""
+    return _MODEL_CACHE.get("ids_sorted") or ()
+
 def generate_reply(
     messages: Sequence[dict[str, Any]],
     api_key: str,
@@ -155,7 +206,7 @@ def generate_reply(
     Returns: Tuple of (reply_text, response_object)
     """
     try:
-        client = openrouter.OpenRouter(api_key=api_key, server_url=server_url)
+        client = _get_client(api_key, server_url)
         response = client.chat.send(
             model=model,
             messages=messages,
@@ -192,14 +243,23 @@ def generate_chat_title(
         {"role": "system", "content": instruction},
         {"role": "user", "content": conversation},
     ]
-    try:
-        title, _ = generate_reply(messages, api_key=api_key, model=model, timeout=timeout, server_url=server_url)
-    except GeminiAPIError as exc:
-        raise GeminiAPIError(f"Failed to generate chat title: {exc}") from exc
-    clean_title = title.splitlines()[0].strip().strip('.;:')
-    if len(clean_title) > 80:
-        clean_title = clean_title[:80].rstrip()
-    return clean_title or "New chat"
+
+    def _fetch_title() -> str:
+        try:
+            title, _ = generate_reply(messages, api_key=api_key, model=model, timeout=timeout, server_url=server_url)
+        except GeminiAPIError as exc:
+            raise GeminiAPIError(f"Failed to generate chat title: {exc}") from exc
+        clean_title = title.splitlines()[0].strip().strip('.;:')
+        if len(clean_title) > 80:
+            clean_title = clean_title[:80].rstrip()
+        return clean_title or "New chat"
+
+    # The same opening exchange always titles the same way; skip the upstream
+    # call for repeats.
+    cache_key = llm_cache.make_key({"title": conversation, "model": model, "server": server_url})
+    if cache_key is None:
+        return _fetch_title()
+    return llm_cache.get_or_set(cache_key, _fetch_title, ttl=7 * 86400)
 
 def call_api(
     context: Sequence[dict[str, Any]] | str,
@@ -3,6 +3,8 @@ from __future__ import annotations
 
 from typing import Any
 import logging
+import threading
+import time
 
 from google.genai import types
 
@@ -14,12 +16,50 @@ from ..notes.service import (
     delete_note,
     get_note,
     search_notes,
-    serialize_note,
+    serialize_note_minimal,
     update_note,
 )
 
 log = logging.getLogger(__name__)
 
+# Matched in a single except arm instead of three identical ones per handler.
+_NOTE_ERRORS = (NoteNotFoundError, NotePermissionError, NoteStoreError)
+
+# Fields the update_note tool may change, in the order they are applied.
+_UPDATE_KEYS = ("title", "content", "keywords", "triggerWords")
+
+# Agents frequently re-open the same note within one session (search -> get ->
+# update -> get), so serialized get_note results are cached briefly per
+# (uid, note_id) and invalidated by the mutating tools.
+_NOTE_CACHE_TTL_SECONDS = 30
+_NOTE_CACHE_MAX_ENTRIES = 2048
+_note_cache: dict[tuple[str, str], tuple[float, dict[str, Any]]] = {}
+_note_cache_lock = threading.RLock()
+
+
+def _note_cache_get(uid: str, note_id: str) -> dict[str, Any] | None:
+    with _note_cache_lock:
+        cached = _note_cache.get((uid, note_id))
+        if cached is None:
+            return None
+        expires_at, serialized = cached
+        if time.monotonic() >= expires_at:
+            del _note_cache[(uid, note_id)]
+            return None
+        return serialized
+
+
+def _note_cache_store(uid: str, note_id: str, serialized: dict[str, Any]) -> None:
+    with _note_cache_lock:
+        if len(_note_cache) >= _NOTE_CACHE_MAX_ENTRIES:
+            _note_cache.clear()
+        _note_cache[(uid, note_id)] = (time.monotonic() + _NOTE_CACHE_TTL_SECONDS, serialized)
+
+
+def _note_cache_invalidate(uid: str, note_id: str) -> None:
+    with _note_cache_lock:
+        _note_cache.pop((uid, note_id), None)
+
 # Tool/function declarations for Gemini
 NOTES_TOOLS = [
     types.Tool(
@@ -89,6 +129,17 @@ NOTES_TOOLS = [
                             type="INTEGER",
                             description="Maximum number of notes to return (default 10, max 50).",
                         ),
+                        "includeContent": types.Schema(
+                            type="BOOLEAN",
+                            description=(
+                                "Return the full content of matching notes directly so you do not "
+                                "need a follow-up get_note call per result."
+                            ),
+                        ),
+                        "contentLimit": types.Schema(
+                            type="INTEGER",
+                            description="Return full content only for the top N results (implies includeContent).",
+                        ),
                     },
                     required=[],
                 ),
@@ -160,6 +211,25 @@ NOTES_TOOLS = [
     )
 ]
 
+# Pre-serialized copy of NOTES_TOOLS, computed once at import time. Serializing
+# the Pydantic tool models per request costs validation + dict construction on
+# every AI call, so request-time call sites should send this frozen copy instead
+# of re-dumping NOTES_TOOLS. Stored as a tuple so call sites cannot mutate it.
+NOTES_TOOLS_CACHED_JSON: tuple[dict[str, Any], ...] = tuple(
+    tool.model_dump(exclude_none=True) for tool in NOTES_TOOLS
+)
+
+
+def _ok(result: dict[str, Any]) -> dict[str, Any]:
+    """Build the success envelope for a tool result."""
+    return {"success": True, "result": result}
+
+
+def _err(message: str) -> dict[str, Any]:
+    """Build the error envelope for a failed tool call."""
+    return {"success": False, "error": message}
+
+
 
 def execute_tool_call(
     tool_name: str,
@@ -182,34 +252,21 @@ def execute_tool_call(
     Returns:
         Dictionary with 'success' boolean and either 'result' or 'error' key
     """
-    log.info("Executing tool %s for user %s, chat %s, message %s with args: %s", tool_name, uid, chat_id, message_id, args)
+    log.info("Executing tool %s for user %s, chat %s, message %s", tool_name, uid, chat_id, message_id)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Tool %s args: %s", tool_name, args)
     try:
-        result = None
-        if tool_name == "create_note":
-            result = _execute_create_note(args, uid, chat_id=chat_id, message_id=message_id)
-        elif tool_name == "search_notes":
-            result = _execute_search_notes(args, uid)
-        elif tool_name == "get_note":
-            result = _execute_get_note(args, uid)
-        elif tool_name == "update_note":
-            result = _execute_update_note(args, uid, chat_id=chat_id, message_id=message_id)
-        elif tool_name == "delete_note":
-            result = _execute_delete_note(args, uid, chat_id=chat_id, message_id=message_id)
+        handler = _DISPATCH.get(tool_name)
+        if handler is None:
+            result = _err(f"Unknown tool: {tool_name}")
         else:
-            result = {
-                "success": False,
-                "error": f"Unknown tool: {tool_name}",
-            }
-        log.info("Tool %s executed successfully for user %s: %s", tool_name, uid, result)
+            result = handler(args, uid, chat_id=chat_id, message_id=message_id)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Tool %s result for user %s: %s", tool_name, uid, result)
         return result
     except Exception as exc:
         log.exception("Tool execution error for %s: %s", tool_name, exc)
-        result = {
-            "success": False,
-            "error": str(exc),
-        }
-        log.error("Tool %s failed for user %s: %s", tool_name, uid, result)
-        return result
+        return _err(str(exc))
 
 
 def _execute_create_note(
@@ -231,22 +288,18 @@ def _execute_create_note(
             chat_id=chat_id,
             message_id=message_id,
         )
-        serialized = serialize_note(note["id"], note)
-        return {
-            "success": True,
-            "result": {
-                "id": serialized["id"],
-                "title": serialized["title"],
-                "content": serialized["content"],
-                "keywords": serialized["keywords"],
-                "triggerWords": serialized["triggerWords"],
-            },
-        }
+        return _ok(serialize_note_minimal(note["id"], note))
     except NoteStoreError as exc:
-        return {"success": False, "error": str(exc)}
+        return _err(str(exc))
 
 
-def _execute_search_notes(args: dict[str, Any], uid: str) -> dict[str, Any]:
+def _execute_search_notes(
+    args: dict[str, Any],
+    uid: str,
+    *,
+    chat_id: str | None = None,
+    message_id: str | None = None,
+) -> dict[str, Any]:
     """Execute search_notes tool."""
     try:
         limit = min(args.get("limit", 10), 50)
@@ -257,50 +310,52 @@ def _execute_search_notes(args: dict[str, Any], uid: str) -> dict[str, Any]:
             trigger_terms=args.get("triggerWords"),
             limit=limit,
         )
-        # Return only id, title, and keywords for search results
-        results = [
-            {
+        # Return id, title, and keywords; optionally inline content for the
+        # top results so the model avoids a get_note round-trip per match.
+        content_limit = args.get("contentLimit")
+        include_content = bool(args.get("includeContent")) or bool(content_limit)
+        if include_content and not isinstance(content_limit, int):
+            content_limit = len(notes)
+
+        results = []
+        for index, note in enumerate(notes):
+            # search_notes normalizes these keys, so index directly.
+            entry = {
                 "id": note["id"],
-                "title": note.get("title", ""),
-                "keywords": note.get("keywords", []),
+                "title": note["title"],
+                "keywords": note["keywords"],
             }
-            for note in notes
-        ]
-        return {
-            "success": True,
-            "result": {"notes": results, "count": len(results)},
-        }
+            if include_content and index < content_limit:
+                entry["content"] = note.get("content", "")
+            results.append(entry)
+        return _ok({"notes": results, "count": len(results)})
     except NoteStoreError as exc:
-        return {"success": False, "error": str(exc)}
+        return _err(str(exc))
 
 
-def _execute_get_note(args: dict[str, Any], uid: str) -> dict[str, Any]:
+def _execute_get_note(
+    args: dict[str, Any],
+    uid: str,
+    *,
+    chat_id: str | None = None,
+    message_id: str | None = None,
+) -> dict[str, Any]:
     """Execute get_note tool."""
     note_id = args.get("note_id")
     if not note_id:
-        return {"success": False, "error": "note_id is required"}
+        return _err("note_id is required")
     
+    cached = _note_cache_get(uid, note_id)
+    if cached is not None:
+        return _ok(cached)
+
     try:
         note = get_note(note_id, uid)
-        serialized = serialize_note(note["id"], note)
-        return {
-            "success": True,
-            "result": {
-                "id": serialized["id"],
-                "title": serialized["title"],
-                "content": serialized["content"],
-                "keywords": serialized["keywords"],
-                "triggerWords": serialized["triggerWords"],
-                "createdAt": serialized["createdAt"],
-                "updatedAt": serialized["updatedAt"],
-            },
-        }
-    except NoteNotFoundError as exc:
-        return {"success": False, "error": str(exc)}
-    except NotePermissionError as exc:
-        return {"success": False, "error": str(exc)}
-    except NoteStoreError as exc:
-        return {"success": False, "error": str(exc)}
+        serialized = serialize_note_minimal(note["id"], note, include_timestamps=True)
+        _note_cache_store(uid, note_id, serialized)
+        return _ok(serialized)
+    except _NOTE_ERRORS as exc:
+        return _err(str(exc))
 
 
 def _execute_update_note(
@@ -313,22 +368,14 @@ def _execute_update_note(
     """Execute update_note tool."""
     note_id = args.get("note_id")
     if not note_id:
-        return {"success": False, "error": "note_id is required"}
-    
+        return _err("note_id is required")
+
     # Build updates dict from provided arguments
-    updates = {}
-    if "title" in args:
-        updates["title"] = args["title"]
-    if "content" in args:
-        updates["content"] = args["content"]
-    if "keywords" in args:
-        updates["keywords"] = args["keywords"]
-    if "triggerWords" in args:
-        updates["triggerWords"] = args["triggerWords"]
-    
+    updates = {key: args[key] for key in _UPDATE_KEYS if key in args}
+
     if not updates:
-        return {"success": False, "error": "No fields provided to update"}
-    
+        return _err("No fields provided to update")
+
     try:
         note = update_note(
             note_id,
@@ -338,24 +385,10 @@ def _execute_update_note(
             chat_id=chat_id,
             message_id=message_id,
         )
-        serialized = serialize_note(note["id"], note)
-        return {
-            "success": True,
-            "result": {
-                "id": serialized["id"],
-                "title": serialized["title"],
-                "content": serialized["content"],
-                "keywords": serialized["keywords"],
-                "triggerWords": serialized["triggerWords"],
-                "updatedAt": serialized["updatedAt"],
-            },
-        }
-    except NoteNotFoundError as exc:
-        return {"success": False, "error": str(exc)}
-    except NotePermissionError as exc:
-        return {"success": False, "error": str(exc)}
-    except NoteStoreError as exc:
-        return {"success": False, "error": str(exc)}
+        _note_cache_invalidate(uid, note_id)
+        return _ok(serialize_note_minimal(note["id"], note, include_timestamps=True))
+    except _NOTE_ERRORS as exc:
+        return _err(str(exc))
 
 
 def _execute_delete_note(
@@ -368,7 +401,7 @@ def _execute_delete_note(
     """Execute delete_note tool."""
     note_id = args.get("note_id")
     if not note_id:
-        return {"success": False, "error": "note_id is required"}
+        return _err("note_id is required")
     
     try:
         delete_note(
@@ -378,13 +411,19 @@ def _execute_delete_note(
             chat_id=chat_id,
             message_id=message_id,
         )
-        return {
-            "success": True,
-            "result": {"message": f"Note {note_id} deleted successfully"},
-        }
-    except NoteNotFoundError as exc:
-        return {"success": False, "error": str(exc)}
-    except NotePermissionError as exc:
-        return {"success": False, "error": str(exc)}
-    except NoteStoreError as exc:
-        return {"success": False, "error": str(exc)}
+        _note_cache_invalidate(uid, note_id)
+        return _ok({"message": f"Note {note_id} deleted successfully"})
+    except _NOTE_ERRORS as exc:
+        return _err(str(exc))
+
+
+# Handlers share a uniform (args, uid, *, chat_id, message_id) signature so
+# dispatch is a single dict lookup instead of an if/elif chain on the hot
+# tool-execution path. Handlers that do not track history ignore the extras.
+_DISPATCH: dict[str, Any] = {
+    "create_note": _execute_create_note,
+    "search_notes": _execute_search_notes,
+    "get_note": _execute_get_note,
+    "update_note": _execute_update_note,
+    "delete_note": _execute_delete_note,
+}
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import hashlib
+import threading
+import time
 from dataclasses import dataclass
 from http import HTTPStatus
 from typing import Any
@@ -8,6 +11,42 @@ from flask import Request, jsonify, request
 from firebase_admin import auth as firebase_auth
 from firebase_admin import exceptions as firebase_exceptions
 
+# Successful token verifications are cached briefly so repeat calls with the
+# same ID token (an agent session can hit dozens of endpoints per minute) skip
+# the RSA signature check. Only the token hash is kept, never the token itself.
+_TOKEN_CACHE_TTL_SECONDS = 300
+_TOKEN_CACHE_MAX_ENTRIES = 10_000
+_token_cache: dict[bytes, tuple[float, dict[str, Any]]] = {}
+_token_cache_lock = threading.Lock()
+
+
+def verify_id_token_cached(id_token: str) -> dict[str, Any]:
+    """Verify a Firebase ID token, reusing a recent verification when possible.
+
+    Raises the same exceptions as :func:`firebase_admin.auth.verify_id_token`.
+    Cached claims are only returned while the token itself has not expired.
+    """
+
+    key = hashlib.blake2b(id_token.encode("utf-8"), digest_size=16).digest()
+    now = time.time()
+
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            cached_until, decoded = cached
+            if now < cached_until and decoded.get("exp", 0) > now + 10:
+                return decoded
+            del _token_cache[key]
+
+    decoded = firebase_auth.verify_id_token(id_token)
+
+    with _token_cache_lock:
+        if len(_token_cache) >= _TOKEN_CACHE_MAX_ENTRIES:
+            _token_cache.clear()
+        _token_cache[key] = (now + _TOKEN_CACHE_TTL_SECONDS, decoded)
+
+    return decoded
+
 
 class AuthError(Exception):
     """Raised when a request cannot be authenticated."""
@@ -36,6 +75,13 @@ def _extract_bearer_token(req: Request) -> str:
     if not auth_header:
         raise AuthError("unauthorized", "Authorization header is required.", HTTPStatus.UNAUTHORIZED)
 
+    # Fast path: the header is virtually always "Bearer <token>" with a single
+    # space, so a prefix check plus slice avoids the split() allocation.
+    if auth_header[:7].lower() == "bearer ":
+        token = auth_header[7:].strip()
+        if token and " " not in token:
+            return token
+
     parts = auth_header.split()
     if len(parts) != 2 or parts[0].lower() != "bearer":
         raise AuthError("unauthorized", "Authorization header must be of the form 'Bearer <token>'.", HTTPStatus.UNAUTHORIZED)
@@ -53,7 +99,7 @@ def require_firebase_user() -> AuthContext:
     token = _extract_bearer_token(request)
 
     try:
-        decoded = firebase_auth.verify_id_token(token)
+        decoded = verify_id_token_cached(token)
     except firebase_auth.ExpiredIdTokenError:
         raise AuthError("token_expired", "Authentication token has expired.", HTTPStatus.UNAUTHORIZED) from None
     except firebase_auth.InvalidIdTokenError:
@@ -66,7 +112,7 @@ def require_firebase_user() -> AuthContext:
         raise AuthError("firebase_auth_error", str(exc), HTTPStatus.INTERNAL_SERVER_ERROR) from exc
 
     uid = decoded.get("uid")
-    if not isinstance(uid, str) or not uid:
+    if type(uid) is not str or not uid:
         raise AuthError("invalid_token", "Authentication token missing uid claim.", HTTPStatus.UNAUTHORIZED)
 
     return AuthContext(uid=uid, token=token, decoded_token=decoded)
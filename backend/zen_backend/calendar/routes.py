@@ -4,7 +4,7 @@ from functools import wraps
 from http import HTTPStatus
 from typing import Any
 
-from flask import Blueprint, current_app, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request
 
 from ..auth.utils import AuthError, require_firebase_user
 from .service import (
@@ -23,7 +23,14 @@ def _build_service() -> GoogleCalendarService:
         client_secret=current_app.config.get("GOOGLE_CLIENT_SECRET"),
         scopes=tuple(current_app.config.get("GOOGLE_CALENDAR_SCOPES") or ()),
     )
-    return GoogleCalendarService(config=config)
+    # Reuse one service (and its pooled HTTP session) per app instead of
+    # rebuilding both on every request; rebuild only if the config changes.
+    service: GoogleCalendarService | None = current_app.extensions.get("google_calendar_service")
+    if service is not None and service.config == config:
+        return service
+    service = GoogleCalendarService(config=config)
+    current_app.extensions["google_calendar_service"] = service
+    return service
 
 
 def _calendar_endpoint(fn):
@@ -49,7 +56,8 @@ def _serialize_connection(record: StoredGoogleTokens | None) -> dict[str, Any]:
     return {
         "connected": True,
         "provider": "google",
-        "scopes": list(record.scope),
+        # The orjson provider serializes tuples as arrays, so no list() copy.
+        "scopes": record.scope,
         "expiresAt": record.expires_at.isoformat() if record.expires_at else None,
         "tokenType": record.token_type,
         "hasRefreshToken": bool(record.refresh_token),
@@ -137,7 +145,9 @@ def list_calendar_events():
         except ValueError:
             raise CalendarError("maxResults must be numeric", code="invalid_request")
 
-    events = service.list_events(
+    # Google's response is already JSON we return unchanged, so stream the
+    # bytes through without a parse/re-encode round-trip.
+    body = service.list_events_raw(
         auth_ctx.uid,
         calendar_id=calendar_id,
         time_min=time_min,
@@ -146,7 +156,7 @@ def list_calendar_events():
         sync_token=sync_token,
         order_by=order_by,
     )
-    return jsonify(events), HTTPStatus.OK
+    return Response(body or b"null", mimetype="application/json"), HTTPStatus.OK
 
 
 @calendar_bp.post("/events")
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timedelta, timezone
 from http import HTTPStatus
 import logging
+import threading
+import time
 from typing import Any, Mapping, MutableMapping, Sequence
-from urllib.parse import urlencode
+from urllib.parse import quote_plus
 
+import orjson
 import requests
 from firebase_admin import firestore as firebase_firestore
 
@@ -28,6 +31,13 @@ def _now() -> datetime:
 def _parse_datetime(value: Any) -> datetime | None:
     if not value:
         return None
+    if isinstance(value, str) and value.endswith("+00:00"):
+        # Fast path: the format save_google_tokens writes (UTC isoformat), so
+        # no Z normalisation or astimezone conversion is needed.
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
     if isinstance(value, datetime):
         if value.tzinfo is None:
             value = value.replace(tzinfo=timezone.utc)
@@ -98,11 +108,17 @@ class StoredGoogleTokens:
     expires_at: datetime | None
     scope: tuple[str, ...]
     token_type: str
+    # Precomputed Authorization header value; saves an f-string per API call.
+    auth_header: str = field(init=False)
+    # Expiry as a POSIX timestamp so is_expired is a float comparison.
+    expires_at_ts: float | None = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.auth_header = "Bearer " + self.access_token
+        self.expires_at_ts = self.expires_at.timestamp() if self.expires_at else None
 
     def is_expired(self, *, skew_seconds: int = 60) -> bool:
-        if self.expires_at is None:
-            return False
-        return self.expires_at - _now() <= timedelta(seconds=skew_seconds)
+        return self.expires_at_ts is not None and self.expires_at_ts - time.time() <= skew_seconds
 
 
 class CalendarCredentialStore:
@@ -111,8 +127,18 @@ class CalendarCredentialStore:
     collection_name = "calendarCredentials"
     provider = "google"
 
+    # Upper bound on how long a loaded record may be served from memory before
+    # re-reading Firestore, even if the access token lives longer.
+    _cache_ttl_seconds = 300
+
     def __init__(self, firestore_client: Any | None = None) -> None:
         self._firestore = firestore_client
+        # Per-uid cache so steady-state calendar calls skip the Firestore read.
+        self._token_cache: dict[str, tuple[float, StoredGoogleTokens]] = {}
+        # Collection and per-uid document references are immutable, so build
+        # each only once instead of on every load/save/delete.
+        self._collection: Any | None = None
+        self._doc_refs: dict[str, Any] = {}
 
     @property
     def firestore(self):
@@ -121,10 +147,44 @@ class CalendarCredentialStore:
         return self._firestore
 
     def _document(self, uid: str):
-        return self.firestore.collection(self.collection_name).document(f"{uid}_{self.provider}")
+        ref = self._doc_refs.get(uid)
+        if ref is None:
+            if self._collection is None:
+                self._collection = self.firestore.collection(self.collection_name)
+            ref = self._doc_refs[uid] = self._collection.document(f"{uid}_{self.provider}")
+        return ref
 
     def save_google_tokens(self, uid: str, record: StoredGoogleTokens) -> StoredGoogleTokens:
         doc_ref = self._document(uid)
+        cached = self._token_cache.get(uid)
+        if cached is not None:
+            # The document exists and we know its last contents, so write only
+            # the fields that actually changed (typically just the access
+            # token and its expiry on a refresh).
+            previous = cached[1]
+            payload: dict[str, Any] = {"updatedAt": firebase_firestore.SERVER_TIMESTAMP}
+            if record.access_token != previous.access_token:
+                payload["accessToken"] = record.access_token
+            if record.refresh_token != previous.refresh_token:
+                payload["refreshToken"] = record.refresh_token
+            if record.token_type != previous.token_type:
+                payload["tokenType"] = record.token_type
+            if record.scope != previous.scope:
+                payload["scopes"] = list(record.scope)
+            if record.expires_at != previous.expires_at:
+                payload["accessTokenExpiresAt"] = (
+                    record.expires_at.isoformat() if record.expires_at else None
+                )
+                payload["accessTokenExpiresAtMs"] = (
+                    int(record.expires_at.timestamp() * 1000) if record.expires_at else None
+                )
+            try:
+                doc_ref.update(payload)
+            except Exception as exc:  # pragma: no cover - Firestore errors surfaced via tests
+                raise CalendarStoreError(str(exc)) from exc
+            self._cache_tokens(uid, record)
+            return record
+
         payload = {
             "uid": uid,
             "provider": self.provider,
@@ -132,7 +192,13 @@ class CalendarCredentialStore:
             "refreshToken": record.refresh_token,
             "tokenType": record.token_type,
             "scopes": list(record.scope),
+            # ISO string kept for readability/backward compatibility; the
+            # millis field is what load paths parse (integer beats string
+            # parse on every round trip).
             "accessTokenExpiresAt": record.expires_at.isoformat() if record.expires_at else None,
+            "accessTokenExpiresAtMs": (
+                int(record.expires_at.timestamp() * 1000) if record.expires_at else None
+            ),
             "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
             "createdAt": firebase_firestore.SERVER_TIMESTAMP,
         }
@@ -140,9 +206,24 @@ class CalendarCredentialStore:
             doc_ref.set(payload, merge=True)
         except Exception as exc:  # pragma: no cover - Firestore errors surfaced via tests
             raise CalendarStoreError(str(exc)) from exc
+        self._cache_tokens(uid, record)
         return record
 
+    def _cache_tokens(self, uid: str, record: StoredGoogleTokens) -> None:
+        ttl = float(self._cache_ttl_seconds)
+        if record.expires_at is not None:
+            remaining = (record.expires_at - _now()).total_seconds()
+            ttl = min(ttl, max(remaining, 0.0))
+        self._token_cache[uid] = (time.monotonic() + ttl, record)
+
     def load_google_tokens(self, uid: str) -> StoredGoogleTokens:
+        cached = self._token_cache.get(uid)
+        if cached is not None:
+            deadline, record = cached
+            if time.monotonic() < deadline:
+                return record
+            self._token_cache.pop(uid, None)
+
         doc_ref = self._document(uid)
         try:
             snapshot = doc_ref.get()
@@ -152,19 +233,56 @@ class CalendarCredentialStore:
         if not snapshot.exists:
             raise CalendarAuthError("Google Calendar is not connected for this user.")
 
+        record = self._snapshot_to_tokens(snapshot)
+        self._cache_tokens(uid, record)
+        return record
+
+    def load_google_tokens_many(self, uids: Sequence[str]) -> dict[str, StoredGoogleTokens]:
+        """Load tokens for several users with a single Firestore round-trip.
+
+        Users without stored credentials are simply absent from the result.
+        """
+
+        refs = [self._document(uid) for uid in uids]
+        if not refs:
+            return {}
+        try:
+            snapshots = self.firestore.get_all(refs)
+        except Exception as exc:  # pragma: no cover
+            raise CalendarStoreError(str(exc)) from exc
+
+        suffix = f"_{self.provider}"
+        records: dict[str, StoredGoogleTokens] = {}
+        for snapshot in snapshots:
+            if not snapshot.exists:
+                continue
+            uid = snapshot.id[: -len(suffix)] if snapshot.id.endswith(suffix) else snapshot.id
+            record = self._snapshot_to_tokens(snapshot)
+            records[uid] = record
+            self._cache_tokens(uid, record)
+        return records
+
+    @staticmethod
+    def _snapshot_to_tokens(snapshot: Any) -> StoredGoogleTokens:
         data = snapshot.to_dict() or {}
         access_token = data.get("accessToken")
-        if not isinstance(access_token, str) or not access_token:
+        if type(access_token) is not str or not access_token:
             raise CalendarStoreError("Stored calendar credentials are missing an access token.")
+        expires_ms = data.get("accessTokenExpiresAtMs")
+        if isinstance(expires_ms, (int, float)):
+            expires_at = datetime.fromtimestamp(expires_ms / 1000, tz=timezone.utc)
+        else:
+            expires_at = _parse_datetime(data.get("accessTokenExpiresAt"))
         return StoredGoogleTokens(
             access_token=access_token,
             refresh_token=data.get("refreshToken"),
-            expires_at=_parse_datetime(data.get("accessTokenExpiresAt")),
+            expires_at=expires_at,
             scope=tuple(data.get("scopes") or []),
             token_type=data.get("tokenType", "Bearer"),
         )
 
     def delete_google_tokens(self, uid: str) -> None:
+        self._token_cache.pop(uid, None)
         doc_ref = self._document(uid)
         try:
             doc_ref.delete()
@@ -199,7 +317,24 @@ class InMemoryCalendarCredentialStore(CalendarCredentialStore):
         self._entries.pop(uid, None)
 
 
+def _build_http_session() -> requests.Session:
+    """Build the shared session used for Google OAuth and Calendar calls.
+
+    The service instance (and therefore this session) lives for the whole app,
+    so size the keep-alive pool for many worker threads talking to Google
+    concurrently instead of the urllib3 default of 10 connections.
+    """
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=50)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 class GoogleCalendarService:
+    _ETAG_CACHE_MAX_ENTRIES = 1024
+
     def __init__(
         self,
         config: GoogleCalendarConfig,
@@ -209,16 +344,26 @@ class GoogleCalendarService:
     ) -> None:
         self.config = config
         self._store = credential_store or CalendarCredentialStore()
-        self._http = http_session or requests.Session()
+        self._http = http_session or _build_http_session()
+        # Last known-valid tokens per uid; lets steady-state API calls skip
+        # the credential-store load while the access token still has slack.
+        self._last_valid: dict[str, StoredGoogleTokens] = {}
+        # Scopes never change after construction, so resolve the tuple and the
+        # space-joined form once instead of per call.
+        self.scopes: tuple[str, ...] = (
+            tuple(scope for scope in (config.scopes or DEFAULT_SCOPES) if scope) or DEFAULT_SCOPES
+        )
+        self._scope_str = " ".join(self.scopes)
+        # ETag cache for raw GET passthroughs: key -> (etag, body bytes).
+        # A 304 from Google lets us reuse the cached body without transferring
+        # or parsing the full event list again. Guarded by a lock so the
+        # clear-on-full eviction cannot race concurrent lookups.
+        self._etag_cache: dict[tuple[Any, ...], tuple[str, bytes]] = {}
+        self._etag_cache_lock = threading.Lock()
 
     # ------------------------------------------------------------------
     # Configuration helpers
     # ------------------------------------------------------------------
-    @property
-    def scopes(self) -> tuple[str, ...]:
-        scopes = tuple(scope for scope in (self.config.scopes or DEFAULT_SCOPES) if scope)
-        return scopes or DEFAULT_SCOPES
-
     def _require_credentials(self) -> None:
         if not self.config.client_id or not self.config.client_secret:
             raise CalendarConfigError("Google API credentials are not configured.")
@@ -241,22 +386,24 @@ class GoogleCalendarService:
         if not redirect_uri:
             raise CalendarError("redirectUri is required", code="invalid_request")
 
-        params: MutableMapping[str, str] = {
-            "client_id": self.config.client_id or "",
-            "response_type": "code",
-            "redirect_uri": redirect_uri,
-            "scope": " ".join(self.scopes),
-            "access_type": access_type,
-            "include_granted_scopes": "true",
-            "prompt": prompt,
-        }
+        # Only the variable fields need percent-encoding; the fixed params are
+        # already URL-safe, so skip the dict + urlencode pass entirely.
+        parts = [
+            f"client_id={quote_plus(self.config.client_id or '')}",
+            "response_type=code",
+            f"redirect_uri={quote_plus(redirect_uri)}",
+            f"scope={quote_plus(self._scope_str)}",
+            f"access_type={quote_plus(access_type)}",
+            "include_granted_scopes=true",
+            f"prompt={quote_plus(prompt)}",
+        ]
         if state:
-            params["state"] = state
+            parts.append(f"state={quote_plus(state)}")
         if code_challenge:
-            params["code_challenge"] = code_challenge
-            params["code_challenge_method"] = code_challenge_method
+            parts.append(f"code_challenge={quote_plus(code_challenge)}")
+            parts.append(f"code_challenge_method={quote_plus(code_challenge_method)}")
 
-        return f"{AUTH_BASE_URL}?{urlencode(params)}"
+        return AUTH_BASE_URL + "?" + "&".join(parts)
 
     def exchange_code(
         self,
@@ -301,13 +448,7 @@ class GoogleCalendarService:
         }
         tokens = self._exchange_token(payload, fallback_refresh_token=refresh_token)
         if tokens.refresh_token is None:
-            tokens = StoredGoogleTokens(
-                access_token=tokens.access_token,
-                refresh_token=refresh_token,
-                expires_at=tokens.expires_at,
-                scope=tokens.scope,
-                token_type=tokens.token_type,
-            )
+            tokens = replace(tokens, refresh_token=refresh_token)
         return self._store.save_google_tokens(uid, tokens)
 
     def _exchange_token(
@@ -322,14 +463,16 @@ class GoogleCalendarService:
             raise CalendarApiError(f"Failed to contact Google token endpoint: {exc}") from exc
 
         if response.status_code != HTTPStatus.OK:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Google token endpoint error body: %s", response.text)
             raise CalendarApiError(
-                f"Google token endpoint returned {response.status_code}: {response.text}",
+                f"Google token endpoint returned {response.status_code}",
                 code="google_token_error",
             )
 
-        data = response.json()
+        data = orjson.loads(response.content)
         access_token = data.get("access_token")
-        if not isinstance(access_token, str) or not access_token:
+        if type(access_token) is not str or not access_token:
             raise CalendarApiError(
                 "Google token response was missing an access_token",
                 code="google_token_error",
@@ -375,6 +518,7 @@ class GoogleCalendarService:
                 self._http.post(REVOKE_ENDPOINT, params={"token": token_to_revoke}, timeout=15)
             except requests.RequestException as exc:  # pragma: no cover - network failures
                 log.warning("Failed to revoke Google token: %s", exc)
+        self._last_valid.pop(uid, None)
         self._store.delete_google_tokens(uid)
 
     # ------------------------------------------------------------------
@@ -408,6 +552,40 @@ class GoogleCalendarService:
         endpoint = f"/calendars/{calendar_id}/events"
         return self._call_calendar_api("GET", endpoint, uid, params=params)
 
+    def list_events_raw(
+        self,
+        uid: str,
+        *,
+        calendar_id: str = "primary",
+        time_min: str | None = None,
+        time_max: str | None = None,
+        max_results: int | None = None,
+        sync_token: str | None = None,
+        single_events: bool = True,
+        order_by: str = "startTime",
+    ) -> bytes:
+        """Like :meth:`list_events`, but return Google's JSON bytes untouched.
+
+        The event list is passed straight through to the client, so skipping
+        the parse/re-encode round-trip saves the most on the largest payloads.
+        """
+
+        params: MutableMapping[str, Any] = {
+            "singleEvents": str(single_events).lower(),
+            "orderBy": order_by,
+        }
+        if time_min:
+            params["timeMin"] = time_min
+        if time_max:
+            params["timeMax"] = time_max
+        if max_results:
+            params["maxResults"] = max(1, min(int(max_results), 2500))
+        if sync_token:
+            params["syncToken"] = sync_token
+
+        endpoint = f"/calendars/{calendar_id}/events"
+        return self._call_calendar_api("GET", endpoint, uid, params=params, raw=True)
+
     def create_event(
         self,
         uid: str,
@@ -415,7 +593,7 @@ class GoogleCalendarService:
         event: Mapping[str, Any],
         calendar_id: str = "primary",
     ) -> dict[str, Any]:
-        if not isinstance(event, Mapping):
+        if type(event) is not dict:
             raise CalendarError("event payload must be an object", code="invalid_event")
         endpoint = f"/calendars/{calendar_id}/events"
         return self._call_calendar_api("POST", endpoint, uid, json=event, expected_statuses=(HTTPStatus.OK, HTTPStatus.CREATED))
@@ -436,11 +614,16 @@ class GoogleCalendarService:
     # Internal helpers
     # ------------------------------------------------------------------
     def _ensure_valid_tokens(self, uid: str) -> StoredGoogleTokens:
+        cached = self._last_valid.get(uid)
+        if cached is not None and not cached.is_expired():
+            return cached
+
         tokens = self._store.load_google_tokens(uid)
         if tokens.is_expired() and tokens.refresh_token:
             tokens = self.refresh_access_token(uid, tokens.refresh_token)
         elif tokens.is_expired():
             raise CalendarAuthError("Stored access token has expired and no refresh token is available.")
+        self._last_valid[uid] = tokens
         return tokens
 
     def _call_calendar_api(
@@ -452,46 +635,84 @@ class GoogleCalendarService:
         params: MutableMapping[str, Any] | None = None,
         json: Mapping[str, Any] | None = None,
         expected_statuses: Sequence[HTTPStatus] = (HTTPStatus.OK,),
+        raw: bool = False,
     ) -> Any:
         tokens = self._ensure_valid_tokens(uid)
         url = f"{CALENDAR_BASE_URL}{endpoint}"
         headers = {
-            "Authorization": f"Bearer {tokens.access_token}",
+            "Authorization": tokens.auth_header,
             "Accept": "application/json",
         }
+
+        cache_key: tuple[Any, ...] | None = None
+        cached_entry: tuple[str, bytes] | None = None
+        if raw and method == "GET":
+            cache_key = (uid, endpoint, tuple(sorted(params.items())) if params else ())
+            with self._etag_cache_lock:
+                cached_entry = self._etag_cache.get(cache_key)
+            if cached_entry is not None:
+                headers["If-None-Match"] = cached_entry[0]
+
+        # Serialize the body once so a 401 retry resends the same bytes
+        # instead of re-encoding the event payload.
+        data: bytes | None = None
+        if json is not None:
+            data = orjson.dumps(json)
+            headers["Content-Type"] = "application/json"
+
         try:
             response = self._http.request(
                 method,
                 url,
                 headers=headers,
                 params=params,
-                json=json,
+                data=data,
                 timeout=20,
             )
         except requests.RequestException as exc:
             raise CalendarApiError(f"Failed to contact Google Calendar API: {exc}") from exc
 
         if response.status_code == HTTPStatus.UNAUTHORIZED and tokens.refresh_token:
+            self._last_valid.pop(uid, None)
             tokens = self.refresh_access_token(uid, tokens.refresh_token)
-            headers["Authorization"] = f"Bearer {tokens.access_token}"
+            self._last_valid[uid] = tokens
+            headers["Authorization"] = tokens.auth_header
             try:
                 response = self._http.request(
                     method,
                     url,
                     headers=headers,
                     params=params,
-                    json=json,
+                    data=data,
                     timeout=20,
                 )
             except requests.RequestException as exc:
                 raise CalendarApiError(f"Failed to contact Google Calendar API: {exc}") from exc
 
+        if cache_key is not None:
+            if response.status_code == HTTPStatus.NOT_MODIFIED:
+                # A 304 can only happen when If-None-Match was sent, so the
+                # entry captured before the request is the right body even if
+                # the cache has been evicted since.
+                if cached_entry is not None:
+                    return cached_entry[1]
+            elif response.status_code == HTTPStatus.OK:
+                etag = response.headers.get("ETag") if hasattr(response, "headers") else None
+                if etag:
+                    with self._etag_cache_lock:
+                        if len(self._etag_cache) >= self._ETAG_CACHE_MAX_ENTRIES:
+                            self._etag_cache.clear()
+                        self._etag_cache[cache_key] = (etag, response.content)
+
         if response.status_code not in expected_statuses:
             raise CalendarApiError(
                 f"Google Calendar API error {response.status_code}: {response.text}",
                 code="google_calendar_error",
             )
 
+        if raw:
+            return response.content
+
         if response.status_code == HTTPStatus.NO_CONTENT or not response.content:
             return None
 
@@ -1,549 +1,924 @@
-from __future__ import annotations
-
-from contextlib import nullcontext
-from datetime import datetime, timezone
-from flask import Blueprint, request, current_app, url_for, jsonify, send_file, Response, stream_with_context
-from http import HTTPStatus
-from pathlib import Path
-from typing import Any, Iterable, Sequence
-
-from ..ai.ai_adapter import ai_adapter
-
-import json
-import logging
-import mimetypes
-import re
-
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from datetime import datetime, timezone
+from flask import Blueprint, request, current_app, jsonify, send_file, Response, stream_with_context
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+from ..ai.ai_adapter import ai_adapter
+
+import hashlib
+import json
+import logging
+import mimetypes
+import orjson
+import re
+import threading
+import time
+
 from ..ai.gemini import (
     GeminiAPIError,
     DEFAULT_MODEL,
     generate_reply,
     generate_chat_title,
+    list_available_model_ids,
     list_available_models,
+    sorted_model_ids,
     stream_reply,
 )
-from ..ai.prompts import DEFAULT_SYSTEM_INSTRUCTION
-from ..ai.tools import NOTES_TOOLS, execute_tool_call
-from ..firebase import get_firestore_client
-from ..auth.utils import AuthError, require_firebase_user
-from ..notes.service import find_notes_for_text, format_note_for_context
-
-from google.api_core import exceptions as google_exceptions
-
-chats_bp = Blueprint("chats", __name__, url_prefix="/chats")
-log = logging.getLogger(__name__)
-
-DEFAULT_INLINE_ATTACHMENT_MAX_BYTES = 350_000
-
-
-def _sse_message(payload: dict[str, Any], event: str | None = None) -> str:
-    body = json.dumps(payload, ensure_ascii=False)
-    lines: list[str] = []
-    if event:
-        lines.append(f"event: {event}")
-    for line in body.splitlines() or [""]:
-        lines.append(f"data: {line}")
-    return "\n".join(lines) + "\n\n"
-
-
-def _extract_text_from_event(event: Any) -> str:
-    try:
-        text = getattr(event, "text", None)
-    except ValueError:
-        text = None
-    except Exception:
-        text = None
-    if isinstance(text, str) and text:
-        return text
-
-    # Handle OpenRouter SDK streaming response (ChatStreamingResponseChunkData)
-    choices = getattr(event, "choices", None)
-    if isinstance(choices, (list, tuple)) and choices:
-        choice = choices[0]
-        delta = getattr(choice, "delta", None)
-        if delta is not None:
-            # Try to get content from delta object
-            content = getattr(delta, "content", None)
-            if isinstance(content, str) and content:
-                return content
-            # Fallback for dict-like delta
-            if isinstance(delta, dict):
-                maybe_content = delta.get("content")
-                if isinstance(maybe_content, str) and maybe_content:
-                    return maybe_content
-
-    delta = getattr(event, "delta", None)
-    delta_text = getattr(delta, "text", None) if delta is not None else None
-    if isinstance(delta_text, str) and delta_text:
-        return delta_text
-    if isinstance(delta, dict):
-        maybe = delta.get("text")
-        if isinstance(maybe, str) and maybe:
-            return maybe
-
-    candidates = getattr(event, "candidates", None)
-    if isinstance(candidates, (list, tuple)) and candidates:
-        candidate = candidates[0]
-        content = getattr(candidate, "content", None)
-        parts = getattr(content, "parts", None) if content is not None else None
-        texts: list[str] = []
-        if isinstance(parts, (list, tuple)):
-            for part in parts:
-                part_text = getattr(part, "text", None)
-                if isinstance(part_text, str) and part_text:
-                    texts.append(part_text)
-        if texts:
-            return "".join(texts)
-
-    return ""
-
-
-def _extract_function_calls_from_response(response: Any) -> list[dict[str, Any]]:
-    """Extract function calls from Gemini response."""
-    function_calls = []
-    
-    candidates = getattr(response, "candidates", None)
-    if not isinstance(candidates, (list, tuple)) or not candidates:
-        return function_calls
-    
-    candidate = candidates[0]
-    content = getattr(candidate, "content", None)
-    if content is None:
-        return function_calls
-    
-    parts = getattr(content, "parts", None)
-    if not isinstance(parts, (list, tuple)):
-        return function_calls
-    
-    for part in parts:
-        fn_call = getattr(part, "function_call", None)
-        if fn_call is None:
-            continue
-        
-        name = getattr(fn_call, "name", None)
-        args = getattr(fn_call, "args", None)
-        
-        if name:
-            function_calls.append({
-                "name": name,
-                "args": dict(args) if args else {},
-            })
-    
-    return function_calls
-
-
-def _extract_function_calls_from_event(event: Any) -> list[dict[str, Any]]:
-    """Extract function calls from a Gemini streaming event."""
-    function_calls = []
-    
-    candidates = getattr(event, "candidates", None)
-    if not isinstance(candidates, (list, tuple)):
-        return function_calls
-    
-    for candidate in candidates:
-        content = getattr(candidate, "content", None)
-        if content is None:
-            continue
-            
-        parts = getattr(content, "parts", None)
-        if not isinstance(parts, (list, tuple)):
-            continue
-            
-        for part in parts:
-            function_call = getattr(part, "function_call", None)
-            if function_call is not None:
-                name = getattr(function_call, "name", None)
-                args = getattr(function_call, "args", None)
-                if name and args:
-                    function_calls.append({
-                        "name": name,
-                        "args": args if isinstance(args, dict) else {},
-                    })
-    
-    return function_calls
-
-
-def _generate_assistant_reply_with_tools(
-    history_messages: Sequence[dict[str, Any]],
-    *,
-    api_key: str,
-    uid: str,
-    chat_id: str,
-    user_message_id: str,
-    tools: list[Any] | None = None,
-    max_iterations: int = 5,
-    server_url: str | None = None,
-) -> str:
-    conversation_with_tools = list(history_messages)
-    iteration = 0
-    active_tools = tools or NOTES_TOOLS
-
-    while iteration < max_iterations:
-        ai_reply, response = generate_reply(
-            conversation_with_tools,
-            api_key=api_key,
-            tools=active_tools,
-            server_url=server_url,
-        )
-
-        function_calls = _extract_function_calls_from_response(response)
-        if not function_calls:
-            return ai_reply
-
-        tool_results = []
-        for fn_call in function_calls:
-            result = execute_tool_call(
-                fn_call["name"],
-                fn_call.get("args", {}),
-                uid,
-                chat_id=chat_id,
-                message_id=user_message_id,
-            )
-            tool_results.append({
-                "name": fn_call.get("name"),
-                "result": result,
-            })
-
-        # Format tool results in a more readable way for the AI
-        results_parts = []
-        for tool_result in tool_results:
-            name = tool_result.get("name")
-            result = tool_result.get("result", {})
-            
-            if result.get("success"):
-                if name == "search_notes" and "result" in result:
-                    notes_data = result["result"]
-                    notes = notes_data.get("notes", [])
-                    results_parts.append(f"search_notes found {len(notes)} notes:")
-                    for i, note in enumerate(notes):
-                        note_id = note.get("id")
-                        title = note.get("title", "Untitled")
-                        keywords = note.get("keywords", [])
-                        results_parts.append(f"  Note {i+1}: ID={note_id}, Title='{title}', Keywords={keywords}")
-                elif name == "get_note" and "result" in result:
-                    note_data = result["result"]
-                    note_id = note_data.get("id")
-                    title = note_data.get("title", "Untitled")
-                    content = note_data.get("content", "")
-                    results_parts.append(f"get_note retrieved note {note_id}: Title='{title}', Content='{content[:100]}{'...' if len(content) > 100 else ''}'")
-                elif name == "create_note" and "result" in result:
-                    note_data = result["result"]
-                    note_id = note_data.get("id")
-                    title = note_data.get("title", "Untitled")
-                    results_parts.append(f"create_note created new note {note_id}: Title='{title}'")
-                else:
-                    results_parts.append(f"{name} succeeded: {json.dumps(result.get('result', {}), indent=2)}")
-            else:
-                error = result.get("error", "Unknown error")
-                results_parts.append(f"{name} failed: {error}")
-        
-        results_text = "Tool call results:\n" + "\n".join(results_parts)
-        conversation_with_tools.append({
-            "role": "system",
-            "content": results_text,
-        })
-
-        iteration += 1
-
-    log.warning("Hit max tool iterations for chat %s", chat_id)
-    return "I apologize, but I encountered an issue while processing your request."
-
-
-def _parse_json_body() -> dict[str, Any]:
-    if request.is_json:
-        payload = request.get_json(silent=True) or {}
-    else:
-        payload = {}
-    return payload
-
-
-def _now() -> datetime:
-    return datetime.now(timezone.utc)
-
-
-def _to_iso(value: Any) -> str | None:
-    if isinstance(value, datetime):
-        if value.tzinfo is None:
-            value = value.replace(tzinfo=timezone.utc)
-        return value.astimezone(timezone.utc).isoformat()
-    return None
-
-
-def _serialize_chat(doc_id: str, data: dict[str, Any]) -> dict[str, Any]:
-    return {
-        "id": doc_id,
-        "uid": data.get("uid"),
-        "title": data.get("title"),
-        "systemPrompt": data.get("systemPrompt"),
-        "createdAt": _to_iso(data.get("createdAt")),
-        "updatedAt": _to_iso(data.get("updatedAt")),
-    }
-
-
-def _serialize_message(doc_id: str, data: dict[str, Any]) -> dict[str, Any]:
-    return {
-        "id": doc_id,
-        "role": data.get("role"),
-        "content": data.get("content"),
-        "createdAt": _to_iso(data.get("createdAt")),
-        "fileIds": data.get("fileIds", []),
-    }
-
-
-def _serialize_file(chat_id: str, doc_id: str, data: dict[str, Any]) -> dict[str, Any]:
-    return {
-        "id": doc_id,
-        "fileName": data.get("fileName"),
-        "mimeType": data.get("mimeType"),
-        "size": data.get("size"),
-        "createdAt": _to_iso(data.get("createdAt")),
-        "downloadPath": url_for("chats.download_file", chat_id=chat_id, file_id=doc_id, _external=False),
-        "textPreview": data.get("textPreview"),
-    }
-
-
-def _get_upload_root() -> Path:
-    upload_dir = current_app.config.get("UPLOADS_DIR")
-    if not upload_dir:
-        raise RuntimeError("UPLOADS_DIR is not configured for the application.")
-    root = Path(upload_dir).resolve()
-    root.mkdir(parents=True, exist_ok=True)
-    return root
-
-
-def _resolve_storage_path(relative_path: str) -> Path:
-    root = _get_upload_root()
-    candidate = (root / relative_path).resolve()
-    if not str(candidate).startswith(str(root)):
-        raise RuntimeError("Resolved file path is outside the uploads directory.")
-    return candidate
-
-
-def _extract_text_snippet(file_path: Path, mime_type: str | None, limit: int = 4000) -> str | None:
-    mime = mime_type or mimetypes.guess_type(file_path.name)[0]
-    if mime is None:
-        return None
-
-    textual_mimes = {
-        "text/plain",
-        "text/markdown",
-        "text/csv",
-        "text/html",
-        "text/xml",
-        "application/json",
-        "application/xml",
-        "application/yaml",
-        "application/x-yaml",
-    }
-
-    if not (mime.startswith("text/") or mime in textual_mimes):
-        return None
-
-    try:
-        with file_path.open("r", encoding="utf-8", errors="ignore") as fp:
-            snippet = fp.read(limit + 1)
-    except OSError:
-        return None
-
-    if len(snippet) > limit:
-        snippet = snippet[:limit]
-
-    return snippet.strip() or None
-
-
-def _get_files_metadata(chat_ref, file_ids: Iterable[str]) -> dict[str, dict[str, Any]]:
-    files_data: dict[str, dict[str, Any]] = {}
-    files_collection = chat_ref.collection("files")
-    for file_id in file_ids:
-        if not file_id or file_id in files_data:
-            continue
-        try:
-            snapshot = files_collection.document(file_id).get()
-        except google_exceptions.PermissionDenied as exc:
-            raise FirestoreAccessError(exc)
-        except google_exceptions.GoogleAPICallError as exc:
-            raise FirestoreAccessError(exc)
-        if snapshot.exists:
-            files_data[file_id] = snapshot.to_dict() or {}
-    return files_data
-
-
-def _compose_message_content(base_content: str, file_ids: Iterable[str], files_data: dict[str, dict[str, Any]]) -> str:
-    content = base_content or ""
-    attachment_blocks: list[str] = []
-    for file_id in file_ids or []:
-        file_info = files_data.get(file_id)
-        if not file_info:
-            continue
-        file_name = file_info.get("fileName") or "Unnamed file"
-        mime_type = file_info.get("mimeType") or "unknown type"
-        size = file_info.get("size")
-        size_text = f"{size} bytes" if isinstance(size, int) else "unknown size"
-        header = f"[Attached file: {file_name} ({mime_type}, {size_text})]"
-        preview = file_info.get("textPreview")
-        if preview:
-            block = f"{header}\n{preview}"
-        else:
-            block = header
-        attachment_blocks.append(block)
-
-    if attachment_blocks:
-        attachments_text = "\n\n".join(attachment_blocks)
-        if content:
-            content = f"{content}\n\n{attachments_text}"
-        else:
-            content = attachments_text
-
-    return content
-
-
-def _max_inline_attachment_bytes() -> int:
-    try:
-        value = int(current_app.config.get("MAX_INLINE_ATTACHMENT_BYTES", DEFAULT_INLINE_ATTACHMENT_MAX_BYTES))
-        return max(1, value)
-    except (TypeError, ValueError):
-        return DEFAULT_INLINE_ATTACHMENT_MAX_BYTES
-
-
-def _build_attachment_descriptors(file_ids: Iterable[str], files_data: dict[str, dict[str, Any]]) -> list[dict[str, Any]]:
-    descriptors: list[dict[str, Any]] = []
-    max_inline_bytes = _max_inline_attachment_bytes()
-
-    for file_id in file_ids or []:
-        file_info = files_data.get(file_id) or {}
-        if not file_info:
-            continue
-
-        cached_descriptor = file_info.get("_gemini_descriptor")
-        if cached_descriptor:
-            descriptors.append(cached_descriptor)
-            continue
-
-        storage_path = file_info.get("storagePath")
-        if not storage_path:
-            continue
-
-        try:
-            absolute_path = _resolve_storage_path(storage_path)
-        except RuntimeError:
-            continue
-
-        if not absolute_path.exists():
-            continue
-
-        mime_type = file_info.get("mimeType") or mimetypes.guess_type(absolute_path.name)[0]
-        if not mime_type:
-            continue
-
-        try:
-            size = absolute_path.stat().st_size
-        except OSError:
-            continue
-
-        if size <= max_inline_bytes:
-            try:
-                data_bytes = absolute_path.read_bytes()
-            except OSError as exc:
-                log.debug("Unable to read file %s for inline attachment: %s", absolute_path, exc)
-                continue
-
-            descriptor = {
-                "type": "bytes",
-                "mime_type": mime_type,
-                "data": data_bytes,
-            }
-        else:
-            descriptor = {
-                "type": "upload",
-                "mime_type": mime_type,
-                "path": str(absolute_path),
-            }
-
-        file_info["_gemini_descriptor"] = descriptor
-        descriptors.append(descriptor)
-
-    return descriptors
-
-
-def _prepare_message_parts(content: str, file_ids: Iterable[str], files_data: dict[str, dict[str, Any]]) -> list[dict[str, Any]]:
-    parts: list[dict[str, Any]] = []
-    text = (content or "").strip()
-    if text:
-        parts.append({"type": "text", "text": text})
-
-    parts.extend(_build_attachment_descriptors(file_ids, files_data))
-    return parts
-
-
-def _get_chat_ref(chat_id: str):
-    db = get_firestore_client()
-    return db.collection("chats").document(chat_id)
-
-
-def _firestore_error_response(exc: Exception) -> tuple[Any, int]:
-    # Provide helpful client-facing messages for common Firestore issues.
-    exc_text = str(exc) or ""
-    lower = exc_text.lower()
-
-    # If the project does not have a Firestore/Datastore database created yet
-    if isinstance(exc, google_exceptions.NotFound) or "does not exist" in lower:
-        # try to extract a project id from the error text
-        m = re.search(r"project\s+([\w-]+)", exc_text)
-        project = m.group(1) if m else None
-        setup_url = (
-            f"https://console.cloud.google.com/datastore/setup?project={project}"
-            if project
-            else "https://console.cloud.google.com/datastore/setup"
-        )
-        message = (
-            "No Cloud Firestore / Cloud Datastore database exists for the configured Google Cloud project. "
-            "Create a database in the Google Cloud Console and retry. "
-            f"Setup: {setup_url}. "
-            "If you've created a named Firestore database, set the FIRESTORE_DATABASE_ID environment variable "
-            "to that database ID so the backend points to it."
-        )
-    else:
-        # Default message when API is disabled or credentials lack permission
-        message = (
-            "Cloud Firestore API is disabled for the configured Google Cloud project "
-            "or the service account does not have permission. Please enable the Firestore API "
-            "and ensure credentials have the required permissions."
-        )
-    return (
-        jsonify({"error": "firestore_service_unavailable", "message": message, "detail": str(exc)}),
-        HTTPStatus.SERVICE_UNAVAILABLE,
-    )
-
-
-class FirestoreAccessError(Exception):
-    """Internal sentinel to indicate a Firestore access issue occurred."""
-
-
-
-def _get_chat_for_user(chat_id: str, uid: str):
-    chat_ref = _get_chat_ref(chat_id)
-    try:
-        chat_snapshot = chat_ref.get()
-    except google_exceptions.PermissionDenied as exc:
-        raise FirestoreAccessError(exc)
-    except google_exceptions.GoogleAPICallError as exc:
-        raise FirestoreAccessError(exc)
-    if not chat_snapshot.exists:
-        return None, None
-
-    data = chat_snapshot.to_dict() or {}
-    if data.get("uid") != uid:
-        return chat_ref, None
-
-    return chat_ref, data
-
-
-@chats_bp.post("")
-def create_chat():
-    return ai_adapter.create_chat()
-
-
-@chats_bp.get("")
+from ..ai import cache as llm_cache
+from ..ai.prompts import DEFAULT_SYSTEM_INSTRUCTION
+from ..ai.tools import NOTES_TOOLS_CACHED_JSON, execute_tool_call
+from ..firebase import get_firestore_client
+from ..auth.utils import AuthError, require_firebase_user
+from ..notes.service import find_notes_for_text, format_note_for_context
+
+from google.api_core import exceptions as google_exceptions
+
+chats_bp = Blueprint("chats", __name__, url_prefix="/chats")
+log = logging.getLogger(__name__)
+
+DEFAULT_INLINE_ATTACHMENT_MAX_BYTES = 350_000
+
+# Executes independent tool calls from a single model turn concurrently.
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# How long identical-prompt LLM responses may be served from the cache. Kept
+# short: chat answers should track model/tool changes, unlike the week-long
+# title cache.
+_LLM_CACHE_TTL_SECONDS = 600
+
+
+def _sse_message(payload: dict[str, Any], event: str | None = None) -> bytes:
+    # Runs once per streamed token: orjson encodes in C and the bytes
+    # replace() handles embedded newlines without splitlines()/list building.
+    body = orjson.dumps(payload)
+    frame = b"data: " + body.replace(b"\n", b"\ndata: ") + b"\n\n"
+    if event:
+        return b"event: " + event.encode() + b"\n" + frame
+    return frame
+
+
+# Static system messages appended on every send; built once and appended by
+# reference. Nothing downstream mutates message dicts.
+_DEFAULT_SYS_MSG = {"role": "system", "content": DEFAULT_SYSTEM_INSTRUCTION}
+_LANG_MSG_WITH_TEXT = {
+    "role": "system",
+    "content": (
+        "Respond in the same language as the most recent user message. Mirror the language used here without translating unless asked."
+    ),
+}
+_LANG_MSG_NO_TEXT = {
+    "role": "system",
+    "content": (
+        "Respond in the same language as the most recent user message when it exists. If the language is unclear, ask the user to clarify before answering."
+    ),
+}
+
+
+def _sse_token_frame(text_chunk: str) -> bytes:
+    # Hottest frame type: splice the encoded chunk into a constant byte
+    # template instead of building a dict per token. JSON string-escaping
+    # means the payload can never contain a raw newline, so the data:
+    # continuation handling in _sse_message is unnecessary here.
+    return b'data: {"type":"token","token":' + orjson.dumps(text_chunk) + b"}\n\n"
+
+
+# Coalescing bounds for streamed token frames: flush when the buffer reaches
+# this size or age, whichever comes first.
+_SSE_FLUSH_BYTES = 16384
+_SSE_FLUSH_SECONDS = 0.02
+# Token deltas shorter than this are merged into one frame inside the
+# streaming loop before a frame is even built.
+_SSE_COALESCE_CHARS = 64
+_SSE_TOKEN_PREFIX = b'data: {"type":"token"'
+
+
+class _TokenMerger:
+    """Groups sub-frame token deltas inside the streaming loop.
+
+    ``add`` buffers each delta and returns the merged text once the buffer
+    reaches ``_SSE_COALESCE_CHARS`` or ``_SSE_FLUSH_SECONDS`` of age, so fast
+    providers don't cost one SSE frame per token; ``flush`` drains whatever
+    remains when the stream ends.
+    """
+
+    __slots__ = ("_pending", "_pending_len", "_last_flush")
+
+    def __init__(self) -> None:
+        self._pending: list[str] = []
+        self._pending_len = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, text_chunk: str) -> str | None:
+        self._pending.append(text_chunk)
+        self._pending_len += len(text_chunk)
+        now = time.monotonic()
+        if self._pending_len >= _SSE_COALESCE_CHARS or now - self._last_flush >= _SSE_FLUSH_SECONDS:
+            merged = "".join(self._pending)
+            self._pending.clear()
+            self._pending_len = 0
+            self._last_flush = now
+            return merged
+        return None
+
+    def flush(self) -> str | None:
+        if not self._pending:
+            return None
+        merged = "".join(self._pending)
+        self._pending.clear()
+        self._pending_len = 0
+        return merged
+
+
+def _coalesce_sse(frames: Iterable[bytes]) -> Iterable[bytes]:
+    """Batch consecutive token frames so each yield is one WSGI write.
+
+    Flushing per model delta costs a syscall per token; buffering into
+    size/time-bounded windows cuts that overhead while non-token frames
+    (errors, message records, named events) still flush immediately.
+    """
+
+    buf: list[bytes] = []
+    buffered = 0
+    last_flush = time.monotonic()
+
+    for frame in frames:
+        if frame.startswith(_SSE_TOKEN_PREFIX):
+            buf.append(frame)
+            buffered += len(frame)
+            now = time.monotonic()
+            if buffered >= _SSE_FLUSH_BYTES or now - last_flush >= _SSE_FLUSH_SECONDS:
+                yield b"".join(buf)
+                buf.clear()
+                buffered = 0
+                last_flush = now
+            continue
+        if buf:
+            buf.append(frame)
+            yield b"".join(buf)
+            buf.clear()
+            buffered = 0
+        else:
+            yield frame
+        last_flush = time.monotonic()
+
+    if buf:
+        yield b"".join(buf)
+
+
+_FAST_MIME = {
+    ".txt": "text/plain",
+    ".md": "text/markdown",
+    ".json": "application/json",
+    ".csv": "text/csv",
+    ".html": "text/html",
+    ".xml": "application/xml",
+    ".yaml": "application/yaml",
+    ".yml": "application/yaml",
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".mp3": "audio/mpeg",
+    ".mp4": "video/mp4",
+}
+
+
+def _guess_mime(name: str) -> str | None:
+    """Resolve common extensions from a local dict before the mimetypes scan."""
+    dot = name.rfind(".")
+    if dot != -1:
+        mime = _FAST_MIME.get(name[dot:].lower())
+        if mime:
+            return mime
+    return mimetypes.guess_type(name)[0]
+
+
+def _extract_text_from_event(event: Any) -> str:
+    try:
+        text = getattr(event, "text", None)
+    except ValueError:
+        text = None
+    except Exception:
+        text = None
+    if isinstance(text, str) and text:
+        return text
+
+    # Handle OpenRouter SDK streaming response (ChatStreamingResponseChunkData)
+    choices = getattr(event, "choices", None)
+    if isinstance(choices, (list, tuple)) and choices:
+        choice = choices[0]
+        delta = getattr(choice, "delta", None)
+        if delta is not None:
+            # Try to get content from delta object
+            content = getattr(delta, "content", None)
+            if isinstance(content, str) and content:
+                return content
+            # Fallback for dict-like delta
+            if isinstance(delta, dict):
+                maybe_content = delta.get("content")
+                if isinstance(maybe_content, str) and maybe_content:
+                    return maybe_content
+
+    delta = getattr(event, "delta", None)
+    delta_text = getattr(delta, "text", None) if delta is not None else None
+    if isinstance(delta_text, str) and delta_text:
+        return delta_text
+    if isinstance(delta, dict):
+        maybe = delta.get("text")
+        if isinstance(maybe, str) and maybe:
+            return maybe
+
+    candidates = getattr(event, "candidates", None)
+    if isinstance(candidates, (list, tuple)) and candidates:
+        candidate = candidates[0]
+        content = getattr(candidate, "content", None)
+        parts = getattr(content, "parts", None) if content is not None else None
+        texts: list[str] = []
+        if isinstance(parts, (list, tuple)):
+            for part in parts:
+                part_text = getattr(part, "text", None)
+                if isinstance(part_text, str) and part_text:
+                    texts.append(part_text)
+        if texts:
+            return "".join(texts)
+
+    return ""
+
+
+def _extract_text_openrouter(event: Any) -> str:
+    """Fast-path extractor for OpenRouter streaming chunks (choices/delta)."""
+    choices = event.choices
+    if choices:
+        content = getattr(choices[0].delta, "content", None)
+        if isinstance(content, str):
+            return content
+    return ""
+
+
+def _select_text_extractor(event: Any) -> Any:
+    """Pick a per-stream extractor once instead of probing every event.
+
+    All events on one connection come from the same SDK, so the shape check
+    only needs to run for the first event.
+    """
+
+    choices = getattr(event, "choices", None)
+    if isinstance(choices, (list, tuple)) and choices and hasattr(choices[0], "delta"):
+        return _extract_text_openrouter
+    return _extract_text_from_event
+
+
+# Shared empty result for the no-tool-calls common case; callers only read it.
+_NO_FUNCTION_CALLS: list[dict[str, Any]] = []
+
+
+def _extract_function_calls_from_response(response: Any) -> list[dict[str, Any]]:
+    """Extract function calls from Gemini response."""
+    # Plain chat replies have no candidates; bail before allocating anything.
+    candidates = getattr(response, "candidates", None)
+    if not isinstance(candidates, (list, tuple)) or not candidates:
+        return _NO_FUNCTION_CALLS
+
+    function_calls = []
+    
+    candidate = candidates[0]
+    content = getattr(candidate, "content", None)
+    if content is None:
+        return _NO_FUNCTION_CALLS
+
+    parts = getattr(content, "parts", None)
+    if not isinstance(parts, (list, tuple)):
+        return _NO_FUNCTION_CALLS
+    
+    for part in parts:
+        fn_call = getattr(part, "function_call", None)
+        if fn_call is None:
+            continue
+        
+        name = getattr(fn_call, "name", None)
+        args = getattr(fn_call, "args", None)
+        
+        if name:
+            function_calls.append({
+                "name": name,
+                "args": dict(args) if args else {},
+            })
+    
+    return function_calls
+
+
+def _extract_function_calls_from_event(event: Any) -> list[dict[str, Any]]:
+    """Extract function calls from a Gemini streaming event."""
+    candidates = getattr(event, "candidates", None)
+    if not isinstance(candidates, (list, tuple)) or not candidates:
+        return _NO_FUNCTION_CALLS
+
+    function_calls = []
+    
+    for candidate in candidates:
+        content = getattr(candidate, "content", None)
+        if content is None:
+            continue
+            
+        parts = getattr(content, "parts", None)
+        if not isinstance(parts, (list, tuple)):
+            continue
+            
+        for part in parts:
+            function_call = getattr(part, "function_call", None)
+            if function_call is not None:
+                name = getattr(function_call, "name", None)
+                args = getattr(function_call, "args", None)
+                if name and args:
+                    function_calls.append({
+                        "name": name,
+                        "args": args if isinstance(args, dict) else {},
+                    })
+    
+    return function_calls
+
+
+def _parse_stream_event(event: Any, extract_text: Any) -> tuple[str, list[dict[str, Any]]]:
+    """Pull the text delta and any function calls from one event probe.
+
+    The streaming loop previously walked every event twice; the
+    function-call check now only recurses when a candidates attribute is
+    actually present (Gemini-shaped events), otherwise the walk goes
+    straight to the text delta.
+    """
+    candidates = getattr(event, "candidates", None)
+    if isinstance(candidates, (list, tuple)) and candidates:
+        calls = _extract_function_calls_from_response(event)
+        if calls:
+            return "", calls
+    return extract_text(event), _NO_FUNCTION_CALLS
+
+
+def _generate_assistant_reply_with_tools(
+    history_messages: Sequence[dict[str, Any]],
+    *,
+    api_key: str,
+    uid: str,
+    chat_id: str,
+    user_message_id: str,
+    tools: list[Any] | None = None,
+    max_iterations: int = 5,
+    server_url: str | None = None,
+) -> str:
+    conversation_with_tools = list(history_messages)
+    iteration = 0
+    active_tools = tools or NOTES_TOOLS_CACHED_JSON
+
+    while iteration < max_iterations:
+        # Identical history + tools means an identical upstream answer, so
+        # serve repeats (re-asks, converging tool loops) from the cache. The
+        # credential is part of the key so accounts never share cached replies;
+        # make_key hashes the payload, so the raw key is not stored.
+        cache_key = llm_cache.make_key({
+            "msgs": conversation_with_tools,
+            "tools": active_tools,
+            "server": server_url,
+            "api_key": api_key,
+        })
+        fetch = lambda: generate_reply(  # noqa: E731
+            conversation_with_tools,
+            api_key=api_key,
+            tools=active_tools,
+            server_url=server_url,
+        )
+        if cache_key is not None:
+            ai_reply, response = llm_cache.get_or_set(cache_key, fetch, ttl=_LLM_CACHE_TTL_SECONDS)
+        else:
+            ai_reply, response = fetch()
+
+        function_calls = _extract_function_calls_from_response(response)
+        if not function_calls:
+            return ai_reply
+
+        def _run_tool_call(fn_call: dict[str, Any]) -> dict[str, Any]:
+            result = execute_tool_call(
+                fn_call["name"],
+                fn_call.get("args", {}),
+                uid,
+                chat_id=chat_id,
+                message_id=user_message_id,
+            )
+            return {"name": fn_call.get("name"), "result": result}
+
+        if len(function_calls) > 1:
+            # Tool calls within one turn are independent, so overlap their
+            # Firestore round-trips instead of executing them serially.
+            tool_results = list(_TOOL_EXECUTOR.map(_run_tool_call, function_calls))
+        else:
+            tool_results = [_run_tool_call(function_calls[0])]
+
+        # Format tool results in a more readable way for the AI
+        results_parts = []
+        for tool_result in tool_results:
+            name = tool_result.get("name")
+            result = tool_result.get("result", {})
+            
+            if result.get("success"):
+                if name == "search_notes" and "result" in result:
+                    notes_data = result["result"]
+                    notes = notes_data.get("notes", [])
+                    results_parts.append(f"search_notes found {len(notes)} notes:")
+                    for i, note in enumerate(notes):
+                        note_id = note.get("id")
+                        title = note.get("title", "Untitled")
+                        keywords = note.get("keywords", [])
+                        results_parts.append(f"  Note {i+1}: ID={note_id}, Title='{title}', Keywords={keywords}")
+                elif name == "get_note" and "result" in result:
+                    note_data = result["result"]
+                    note_id = note_data.get("id")
+                    title = note_data.get("title", "Untitled")
+                    content = note_data.get("content", "")
+                    results_parts.append(f"get_note retrieved note {note_id}: Title='{title}', Content='{content[:100]}{'...' if len(content) > 100 else ''}'")
+                elif name == "create_note" and "result" in result:
+                    note_data = result["result"]
+                    note_id = note_data.get("id")
+                    title = note_data.get("title", "Untitled")
+                    results_parts.append(f"create_note created new note {note_id}: Title='{title}'")
+                else:
+                    results_parts.append(f"{name} succeeded: {json.dumps(result.get('result', {}), indent=2)}")
+            else:
+                error = result.get("error", "Unknown error")
+                results_parts.append(f"{name} failed: {error}")
+        
+        results_text = "Tool call results:\n" + "\n".join(results_parts)
+        conversation_with_tools.append({
+            "role": "system",
+            "content": results_text,
+        })
+
+        iteration += 1
+
+    log.warning("Hit max tool iterations for chat %s", chat_id)
+    return "I apologize, but I encountered an issue while processing your request."
+
+
+def _parse_json_body() -> dict[str, Any]:
+    # cache=True keeps re-reads within the same request free; decoding itself
+    # goes through the app's orjson provider.
+    if request.is_json:
+        return request.get_json(silent=True, cache=True) or {}
+    return {}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _to_iso(value: Any) -> str | None:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+    return None
+
+
+def _serialize_chat(doc_id: str, data: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": doc_id,
+        "uid": data.get("uid"),
+        "title": data.get("title"),
+        "systemPrompt": data.get("systemPrompt"),
+        "createdAt": _to_iso(data.get("createdAt")),
+        "updatedAt": _to_iso(data.get("updatedAt")),
+    }
+
+
+def _serialize_message(doc_id: str, data: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": doc_id,
+        "role": data.get("role"),
+        "content": data.get("content"),
+        "createdAt": _to_iso(data.get("createdAt")),
+        "fileIds": data.get("fileIds", []),
+    }
+
+
+def _serialize_file(chat_id: str, doc_id: str, data: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": doc_id,
+        "fileName": data.get("fileName"),
+        "mimeType": data.get("mimeType"),
+        "size": data.get("size"),
+        "createdAt": _to_iso(data.get("createdAt")),
+        # Format the known route directly; url_for walks the URL map per call,
+        # which adds up when a chat lists hundreds of files.
+        "downloadPath": f"{request.script_root}/chats/{chat_id}/files/{doc_id}/download",
+        "textPreview": data.get("textPreview"),
+    }
+
+
+@lru_cache(maxsize=None)
+def _resolved_upload_root(upload_dir: str) -> Path:
+    # resolve() and mkdir() both hit the filesystem; do them once per
+    # configured directory instead of per attachment.
+    root = Path(upload_dir).resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def _get_upload_root() -> Path:
+    upload_dir = current_app.config.get("UPLOADS_DIR")
+    if not upload_dir:
+        raise RuntimeError("UPLOADS_DIR is not configured for the application.")
+    return _resolved_upload_root(str(upload_dir))
+
+
+def _resolve_storage_path(relative_path: str) -> Path:
+    root = _get_upload_root()
+    candidate = (root / relative_path).resolve()
+    if not candidate.is_relative_to(root):
+        raise RuntimeError("Resolved file path is outside the uploads directory.")
+    return candidate
+
+
+def _extract_text_snippet(file_path: Path, mime_type: str | None, limit: int = 4000) -> str | None:
+    mime = mime_type or _guess_mime(file_path.name)
+    if mime is None:
+        return None
+
+    textual_mimes = {
+        "text/plain",
+        "text/markdown",
+        "text/csv",
+        "text/html",
+        "text/xml",
+        "application/json",
+        "application/xml",
+        "application/yaml",
+        "application/x-yaml",
+    }
+
+    if not (mime.startswith("text/") or mime in textual_mimes):
+        return None
+
+    # Read the prefix in binary and decode once: skips the text-IO layer's
+    # incremental decoding, and a limit+1 read never pulls a huge file in.
+    try:
+        with open(file_path, "rb") as fp:
+            raw = fp.read(limit + 1)
+    except OSError:
+        return None
+
+    if not raw:
+        return None
+
+    snippet = raw.decode("utf-8", errors="ignore")
+    if len(snippet) > limit:
+        snippet = snippet[:limit]
+
+    return snippet.strip() or None
+
+
+def _get_files_metadata(chat_ref, file_ids: Iterable[str]) -> dict[str, dict[str, Any]]:
+    files_data: dict[str, dict[str, Any]] = {}
+    files_collection = chat_ref.collection("files")
+    unique_ids = [file_id for file_id in dict.fromkeys(file_ids) if file_id]
+    if not unique_ids:
+        return files_data
+    try:
+        if len(unique_ids) == 1:
+            # A plain get() avoids the BatchGetDocuments stream setup for the
+            # common single-attachment case.
+            snapshot = files_collection.document(unique_ids[0]).get()
+            if snapshot.exists:
+                files_data[snapshot.id] = snapshot.to_dict() or {}
+            return files_data
+        refs = [files_collection.document(file_id) for file_id in unique_ids]
+        # One streaming RPC for all attachments instead of a get() per file.
+        snapshots = get_firestore_client().get_all(refs)
+        for snapshot in snapshots:
+            if snapshot.exists:
+                files_data[snapshot.id] = snapshot.to_dict() or {}
+    except google_exceptions.PermissionDenied as exc:
+        raise FirestoreAccessError(exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        raise FirestoreAccessError(exc)
+    return files_data
+
+
+def _attachment_block(file_info: dict[str, Any]) -> str:
+    file_name = file_info.get("fileName") or "Unnamed file"
+    mime_type = file_info.get("mimeType") or "unknown type"
+    size = file_info.get("size")
+    size_text = f"{size} bytes" if isinstance(size, int) else "unknown size"
+    header = f"[Attached file: {file_name} ({mime_type}, {size_text})]"
+    preview = file_info.get("textPreview")
+    return f"{header}\n{preview}" if preview else header
+
+
+def _compose_message_content(base_content: str, file_ids: Iterable[str], files_data: dict[str, dict[str, Any]]) -> str:
+    content = base_content or ""
+    # One join over all pieces keeps this O(total) with a single allocation
+    # even for messages carrying many files.
+    attachment_blocks = [
+        _attachment_block(file_info)
+        for file_id in file_ids or []
+        if (file_info := files_data.get(file_id))
+    ]
+    if not attachment_blocks:
+        return content
+    if content:
+        return "\n\n".join([content, *attachment_blocks])
+    return "\n\n".join(attachment_blocks)
+
+
+def _max_inline_attachment_bytes() -> int:
+    try:
+        value = int(current_app.config.get("MAX_INLINE_ATTACHMENT_BYTES", DEFAULT_INLINE_ATTACHMENT_MAX_BYTES))
+        return max(1, value)
+    except (TypeError, ValueError):
+        return DEFAULT_INLINE_ATTACHMENT_MAX_BYTES
+
+
+# Related-notes lookups embed the query text upstream; retries and repeated
+# prompts shouldn't pay that round-trip twice. Keyed by uid plus a digest of
+# the text so no prompt text is retained in the key.
+_NOTES_CACHE_TTL_SECONDS = 120
+_NOTES_CACHE_MAX_ENTRIES = 2048
+_notes_cache: dict[tuple[str, bytes], tuple[float, list[dict[str, Any]]]] = {}
+_notes_cache_lock = threading.Lock()
+
+
+def _find_notes_cached(uid: str, text: str) -> list[dict[str, Any]]:
+    key = (uid, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+    now = time.monotonic()
+    with _notes_cache_lock:
+        cached = _notes_cache.get(key)
+        if cached is not None:
+            cached_until, notes = cached
+            if now < cached_until:
+                return notes
+            del _notes_cache[key]
+
+    notes = find_notes_for_text(uid, text, limit=5)
+
+    with _notes_cache_lock:
+        if len(_notes_cache) >= _NOTES_CACHE_MAX_ENTRIES:
+            _notes_cache.clear()
+        _notes_cache[key] = (now + _NOTES_CACHE_TTL_SECONDS, notes)
+    return notes
+
+
+# LLM context is capped at the most recent messages, so there is no need to
+# re-read an ever-growing history on every send. Warm chats are served from an
+# in-process cache that message writes append to.
+_HISTORY_LIMIT = 40
+_HISTORY_CACHE_MAX_CHATS = 1024
+_history_cache: dict[str, list[tuple[str, dict[str, Any]]]] = {}
+_history_cache_lock = threading.Lock()
+
+
+def _load_history_records(chat_ref) -> list[tuple[str, dict[str, Any]]]:
+    """Return the last ``_HISTORY_LIMIT`` messages as ``(id, data)`` pairs."""
+    with _history_cache_lock:
+        cached = _history_cache.get(chat_ref.id)
+        if cached is not None:
+            return list(cached)
+
+    query = chat_ref.collection("messages").order_by("createdAt").limit_to_last(_HISTORY_LIMIT)
+    records = [(doc.id, doc.to_dict() or {}) for doc in query.get()]
+
+    with _history_cache_lock:
+        if len(_history_cache) >= _HISTORY_CACHE_MAX_CHATS:
+            _history_cache.clear()
+        _history_cache[chat_ref.id] = records
+        return list(records)
+
+
+def _append_history_record(chat_ref, doc_id: str, data: dict[str, Any]) -> None:
+    """Keep the cached history in step with a message we just wrote."""
+    with _history_cache_lock:
+        cached = _history_cache.get(chat_ref.id)
+        if cached is not None:
+            cached.append((doc_id, data))
+            if len(cached) > _HISTORY_LIMIT:
+                del cached[: -_HISTORY_LIMIT]
+
+
+def _read_attachment_bytes(path: Path) -> bytes | None:
+    try:
+        return path.read_bytes()
+    except OSError as exc:
+        log.debug("Unable to read file %s for inline attachment: %s", path, exc)
+        return None
+
+
+def _build_attachment_descriptors(file_ids: Iterable[str], files_data: dict[str, dict[str, Any]]) -> list[dict[str, Any]]:
+    descriptors: list[dict[str, Any] | None] = []
+    max_inline_bytes = _max_inline_attachment_bytes()
+    # Inline reads collected in a first metadata-only pass so the disk I/O can
+    # be overlapped; each entry is (slot in descriptors, file_info, path, mime).
+    pending_reads: list[tuple[int, dict[str, Any], Path, str]] = []
+
+    for file_id in file_ids or []:
+        file_info = files_data.get(file_id) or {}
+        if not file_info:
+            continue
+
+        cached_descriptor = file_info.get("_gemini_descriptor")
+        if cached_descriptor:
+            descriptors.append(cached_descriptor)
+            continue
+
+        storage_path = file_info.get("storagePath")
+        if not storage_path:
+            continue
+
+        try:
+            absolute_path = _resolve_storage_path(storage_path)
+        except RuntimeError:
+            continue
+
+        if not absolute_path.exists():
+            continue
+
+        mime_type = file_info.get("mimeType") or _guess_mime(absolute_path.name)
+        if not mime_type:
+            continue
+
+        try:
+            size = absolute_path.stat().st_size
+        except OSError:
+            continue
+
+        if size <= max_inline_bytes:
+            descriptors.append(None)
+            pending_reads.append((len(descriptors) - 1, file_info, absolute_path, mime_type))
+        else:
+            descriptor = {
+                "type": "upload",
+                "mime_type": mime_type,
+                "path": str(absolute_path),
+            }
+            file_info["_gemini_descriptor"] = descriptor
+            descriptors.append(descriptor)
+
+    if pending_reads:
+        paths = [entry[2] for entry in pending_reads]
+        if len(paths) > 1:
+            datas = list(_TOOL_EXECUTOR.map(_read_attachment_bytes, paths))
+        else:
+            datas = [_read_attachment_bytes(paths[0])]
+        for (slot, file_info, _path, mime_type), data_bytes in zip(pending_reads, datas):
+            if data_bytes is None:
+                continue
+            descriptor = {
+                "type": "bytes",
+                "mime_type": mime_type,
+                "data": data_bytes,
+            }
+            file_info["_gemini_descriptor"] = descriptor
+            descriptors[slot] = descriptor
+
+    return [descriptor for descriptor in descriptors if descriptor is not None]
+
+
+# Composed content is deterministic for a stored message (content, fileIds and
+# file metadata are write-once), so the text formatting only needs to happen
+# the first time a message appears in a history build. Attachment descriptors
+# are deliberately NOT cached here: the inline ones hold the raw file bytes,
+# and pinning those per message would let the cache grow to hundreds of
+# megabytes. They are rebuilt (and re-read from disk) on every call instead.
+_COMPOSED_CACHE_MAX_ENTRIES = 4096
+_composed_cache: dict[str, tuple[str, list[dict[str, Any]]]] = {}
+
+
+def _composed_message(doc_id: str, data: dict[str, Any], file_ids: list[str], files_data: dict[str, dict[str, Any]]) -> tuple[str, list[dict[str, Any]]]:
+    cached = _composed_cache.get(doc_id)
+    if cached is not None:
+        content, text_parts = cached
+    else:
+        content = _compose_message_content(data.get("content", ""), file_ids, files_data)
+        text = content.strip()
+        text_parts = [{"type": "text", "text": text}] if text else []
+        if len(_composed_cache) >= _COMPOSED_CACHE_MAX_ENTRIES:
+            _composed_cache.clear()
+        _composed_cache[doc_id] = (content, text_parts)
+    if not file_ids:
+        return content, list(text_parts)
+    parts = list(text_parts)
+    parts.extend(_build_attachment_descriptors(file_ids, files_data))
+    return content, parts
+
+
+def _get_chat_ref(chat_id: str):
+    db = get_firestore_client()
+    return db.collection("chats").document(chat_id)
+
+
+def _generate_and_store_title(
+    chat_ref,
+    user_message: str,
+    assistant_message: str,
+    api_key: str,
+    model: str,
+    server_url: str | None,
+    updated_at: datetime,
+) -> None:
+    """Generate and persist a chat title off the request thread."""
+    try:
+        title = generate_chat_title(
+            user_message=user_message,
+            assistant_message=assistant_message,
+            api_key=api_key,
+            model=model,
+            server_url=server_url,
+        )
+    except GeminiAPIError as exc:
+        log.warning("Unable to generate chat title: %s", exc)
+        return
+    if not title:
+        return
+    try:
+        chat_ref.update({"title": title, "updatedAt": updated_at})
+    except google_exceptions.PermissionDenied as exc:
+        log.warning("Failed to persist chat title: %s", exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        log.warning("Failed to persist chat title: %s", exc)
+
+
+_PROJECT_RE = re.compile(r"project\s+([\w-]+)")
+_MSG_FIRESTORE_MISSING = (
+    "No Cloud Firestore / Cloud Datastore database exists for the configured Google Cloud project. "
+    "Create a database in the Google Cloud Console and retry. "
+    "Setup: {setup_url}. "
+    "If you've created a named Firestore database, set the FIRESTORE_DATABASE_ID environment variable "
+    "to that database ID so the backend points to it."
+)
+_MSG_FIRESTORE_DISABLED = (
+    "Cloud Firestore API is disabled for the configured Google Cloud project "
+    "or the service account does not have permission. Please enable the Firestore API "
+    "and ensure credentials have the required permissions."
+)
+
+
+def _firestore_error_response(exc: Exception) -> tuple[Any, int]:
+    # Provide helpful client-facing messages for common Firestore issues.
+    exc_text = str(exc) or ""
+    lower = exc_text.lower()
+
+    # If the project does not have a Firestore/Datastore database created yet
+    if isinstance(exc, google_exceptions.NotFound) or "does not exist" in lower:
+        # try to extract a project id from the error text
+        m = _PROJECT_RE.search(exc_text)
+        project = m.group(1) if m else None
+        setup_url = (
+            f"https://console.cloud.google.com/datastore/setup?project={project}"
+            if project
+            else "https://console.cloud.google.com/datastore/setup"
+        )
+        message = _MSG_FIRESTORE_MISSING.format(setup_url=setup_url)
+    else:
+        # Default message when API is disabled or credentials lack permission
+        message = _MSG_FIRESTORE_DISABLED
+    return (
+        jsonify({"error": "firestore_service_unavailable", "message": message, "detail": str(exc)}),
+        HTTPStatus.SERVICE_UNAVAILABLE,
+    )
+
+
+class FirestoreAccessError(Exception):
+    """Internal sentinel to indicate a Firestore access issue occurred."""
+
+
+
+def _get_chat_for_user(chat_id: str, uid: str):
+    chat_ref = _get_chat_ref(chat_id)
+    try:
+        chat_snapshot = chat_ref.get()
+    except google_exceptions.PermissionDenied as exc:
+        raise FirestoreAccessError(exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        raise FirestoreAccessError(exc)
+    if not chat_snapshot.exists:
+        return None, None
+
+    data = chat_snapshot.to_dict() or {}
+    if data.get("uid") != uid:
+        return chat_ref, None
+
+    return chat_ref, data
+
+
+@chats_bp.post("")
+def create_chat():
+    return ai_adapter.create_chat()
+
+
+@chats_bp.get("")
 def list_chats():
     return ai_adapter.list_chats()
 
@@ -600,148 +975,161 @@ def list_chat_models() -> tuple[Any, int]:
 @chats_bp.get("/<chat_id>")
 def get_chat(chat_id: str):
     return ai_adapter.get_chat(chat_id)
-
-
-@chats_bp.patch("/<chat_id>")
-def update_chat(chat_id: str):
-    return ai_adapter.update_chat(chat_id)
-
-
-@chats_bp.delete("/<chat_id>")
-def delete_chat(chat_id: str):
-    return ai_adapter.delete_chat(chat_id)
-
-
-@chats_bp.post("/<chat_id>/files")
-def upload_file(chat_id: str):
-    return ai_adapter.upload_file(chat_id)
-
-
-@chats_bp.get("/<chat_id>/files")
-def list_files(chat_id: str) -> tuple[Any, int]:
-    try:
-        auth_ctx = require_firebase_user()
-    except AuthError as exc:
-        return exc.to_response()
-
-    requested_uid = request.args.get("uid", type=str)
-    if requested_uid and requested_uid != auth_ctx.uid:
-        return (
-            jsonify({"error": "forbidden", "message": "Authenticated user does not match requested uid."}),
-            HTTPStatus.FORBIDDEN,
-        )
-
-    uid = auth_ctx.uid
-
-    try:
-        chat_ref, chat_data = _get_chat_for_user(chat_id, uid)
-    except FirestoreAccessError as exc:
-        return _firestore_error_response(exc)
-    if chat_ref is None:
-        return (
-            jsonify({"error": "not_found", "message": "Chat not found."}),
-            HTTPStatus.NOT_FOUND,
-        )
-    if chat_data is None:
-        return (
-            jsonify({"error": "forbidden", "message": "You do not have access to this chat."}),
-            HTTPStatus.FORBIDDEN,
-        )
-
-    files_ref = chat_ref.collection("files").order_by("createdAt")
-    try:
-        file_docs = list(files_ref.stream())
-    except google_exceptions.PermissionDenied as exc:
-        return _firestore_error_response(exc)
-    except google_exceptions.GoogleAPICallError as exc:
-        return _firestore_error_response(exc)
-
-    files = [
-        _serialize_file(chat_ref.id, doc.id, doc.to_dict() or {})
-        for doc in file_docs
-    ]
-
-    return jsonify({"items": files}), HTTPStatus.OK
-
-
-@chats_bp.get("/<chat_id>/files/<file_id>/download")
-def download_file(chat_id: str, file_id: str):
-    try:
-        auth_ctx = require_firebase_user()
-    except AuthError as exc:
-        return exc.to_response()
-
-    requested_uid = request.args.get("uid", type=str)
-    if requested_uid and requested_uid != auth_ctx.uid:
-        return (
-            jsonify({"error": "forbidden", "message": "Authenticated user does not match requested uid."}),
-            HTTPStatus.FORBIDDEN,
-        )
-
-    uid = auth_ctx.uid
-
-    try:
-        chat_ref, chat_data = _get_chat_for_user(chat_id, uid)
-    except FirestoreAccessError as exc:
-        return _firestore_error_response(exc)
-    if chat_ref is None:
-        return (
-            jsonify({"error": "not_found", "message": "Chat not found."}),
-            HTTPStatus.NOT_FOUND,
-        )
-    if chat_data is None:
-        return (
-            jsonify({"error": "forbidden", "message": "You do not have access to this chat."}),
-            HTTPStatus.FORBIDDEN,
-        )
-
-    files_collection = chat_ref.collection("files")
-    try:
-        snapshot = files_collection.document(file_id).get()
-    except google_exceptions.PermissionDenied as exc:
-        return _firestore_error_response(exc)
-    except google_exceptions.GoogleAPICallError as exc:
-        return _firestore_error_response(exc)
-
-    if not snapshot.exists:
-        return (
-            jsonify({"error": "not_found", "message": "File not found."}),
-            HTTPStatus.NOT_FOUND,
-        )
-
-    data = snapshot.to_dict() or {}
-    storage_path = data.get("storagePath")
-    if not storage_path:
-        return (
-            jsonify({"error": "not_found", "message": "File metadata incomplete."}),
-            HTTPStatus.NOT_FOUND,
-        )
-
-    try:
-        absolute_path = _resolve_storage_path(storage_path)
-    except RuntimeError:
-        return (
-            jsonify({"error": "not_found", "message": "File not available."}),
-            HTTPStatus.NOT_FOUND,
-        )
-
-    if not absolute_path.exists():
-        return (
-            jsonify({"error": "not_found", "message": "File not available."}),
-            HTTPStatus.NOT_FOUND,
-        )
-
-    download_name = data.get("fileName") or absolute_path.name
-    return send_file(
-        absolute_path,
-        mimetype=data.get("mimeType") or mimetypes.guess_type(download_name)[0],
-        as_attachment=True,
-        download_name=download_name,
-        conditional=True,
-    )
-
-
-@chats_bp.post("/<chat_id>/messages")
+
+
+@chats_bp.patch("/<chat_id>")
+def update_chat(chat_id: str):
+    return ai_adapter.update_chat(chat_id)
+
+
+@chats_bp.delete("/<chat_id>")
+def delete_chat(chat_id: str):
+    with _history_cache_lock:
+        _history_cache.pop(chat_id, None)
+    return ai_adapter.delete_chat(chat_id)
+
+
+@chats_bp.post("/<chat_id>/files")
+def upload_file(chat_id: str):
+    return ai_adapter.upload_file(chat_id)
+
+
+@chats_bp.get("/<chat_id>/files")
+def list_files(chat_id: str) -> tuple[Any, int]:
+    try:
+        auth_ctx = require_firebase_user()
+    except AuthError as exc:
+        return exc.to_response()
+
+    requested_uid = request.args.get("uid", type=str)
+    if requested_uid and requested_uid != auth_ctx.uid:
+        return (
+            jsonify({"error": "forbidden", "message": "Authenticated user does not match requested uid."}),
+            HTTPStatus.FORBIDDEN,
+        )
+
+    uid = auth_ctx.uid
+
+    try:
+        chat_ref, chat_data = _get_chat_for_user(chat_id, uid)
+    except FirestoreAccessError as exc:
+        return _firestore_error_response(exc)
+    if chat_ref is None:
+        return (
+            jsonify({"error": "not_found", "message": "Chat not found."}),
+            HTTPStatus.NOT_FOUND,
+        )
+    if chat_data is None:
+        return (
+            jsonify({"error": "forbidden", "message": "You do not have access to this chat."}),
+            HTTPStatus.FORBIDDEN,
+        )
+
+    files_ref = chat_ref.collection("files").order_by("createdAt")
+    try:
+        # Consume the stream lazily so serialization overlaps the Firestore
+        # fetch instead of waiting for the last document.
+        files = [
+            _serialize_file(chat_ref.id, doc.id, doc.to_dict() or {})
+            for doc in files_ref.stream()
+        ]
+    except google_exceptions.PermissionDenied as exc:
+        return _firestore_error_response(exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        return _firestore_error_response(exc)
+
+    return jsonify({"items": files}), HTTPStatus.OK
+
+
+@chats_bp.get("/<chat_id>/files/<file_id>/download")
+def download_file(chat_id: str, file_id: str):
+    try:
+        auth_ctx = require_firebase_user()
+    except AuthError as exc:
+        return exc.to_response()
+
+    requested_uid = request.args.get("uid", type=str)
+    if requested_uid and requested_uid != auth_ctx.uid:
+        return (
+            jsonify({"error": "forbidden", "message": "Authenticated user does not match requested uid."}),
+            HTTPStatus.FORBIDDEN,
+        )
+
+    uid = auth_ctx.uid
+
+    try:
+        chat_ref, chat_data = _get_chat_for_user(chat_id, uid)
+    except FirestoreAccessError as exc:
+        return _firestore_error_response(exc)
+    if chat_ref is None:
+        return (
+            jsonify({"error": "not_found", "message": "Chat not found."}),
+            HTTPStatus.NOT_FOUND,
+        )
+    if chat_data is None:
+        return (
+            jsonify({"error": "forbidden", "message": "You do not have access to this chat."}),
+            HTTPStatus.FORBIDDEN,
+        )
+
+    files_collection = chat_ref.collection("files")
+    try:
+        snapshot = files_collection.document(file_id).get()
+    except google_exceptions.PermissionDenied as exc:
+        return _firestore_error_response(exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        return _firestore_error_response(exc)
+
+    if not snapshot.exists:
+        return (
+            jsonify({"error": "not_found", "message": "File not found."}),
+            HTTPStatus.NOT_FOUND,
+        )
+
+    data = snapshot.to_dict() or {}
+    storage_path = data.get("storagePath")
+    if not storage_path:
+        return (
+            jsonify({"error": "not_found", "message": "File metadata incomplete."}),
+            HTTPStatus.NOT_FOUND,
+        )
+
+    try:
+        absolute_path = _resolve_storage_path(storage_path)
+    except RuntimeError:
+        return (
+            jsonify({"error": "not_found", "message": "File not available."}),
+            HTTPStatus.NOT_FOUND,
+        )
+
+    try:
+        st = absolute_path.stat()
+    except OSError:
+        return (
+            jsonify({"error": "not_found", "message": "File not available."}),
+            HTTPStatus.NOT_FOUND,
+        )
+
+    download_name = data.get("fileName") or absolute_path.name
+    # conditional=True lets Werkzeug use the WSGI file wrapper (sendfile where
+    # the server supports it) and honour Range requests; the explicit size and
+    # Accept-Ranges headers keep large downloads on that zero-copy path.
+    response = send_file(
+        absolute_path,
+        mimetype=data.get("mimeType") or _guess_mime(download_name),
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=True,
+        last_modified=st.st_mtime,
+    )
+    response.headers.setdefault("Accept-Ranges", "bytes")
+    if "Content-Length" not in response.headers:
+        response.headers["Content-Length"] = str(st.st_size)
+    return response
+
+
+@chats_bp.post("/<chat_id>/messages")
 def add_message(chat_id: str) -> tuple[Any, int]:
     payload = _parse_json_body()
 
@@ -750,131 +1138,132 @@ def add_message(chat_id: str) -> tuple[Any, int]:
     role: str = (payload.get("role") or "user").lower()
     requested_model = payload.get("model")
     raw_file_ids = payload.get("fileIds") or []
-
-    if isinstance(raw_file_ids, list):
-        file_ids = []
-        for fid in raw_file_ids:
-            if not isinstance(fid, str):
-                return (
-                    jsonify({"error": "validation_error", "message": "fileIds must be a list of strings."}),
-                    HTTPStatus.BAD_REQUEST,
-                )
-            fid_clean = fid.strip()
-            if not fid_clean:
-                continue
-            if fid_clean not in file_ids:
-                file_ids.append(fid_clean)
-    elif raw_file_ids:
-        return (
-            jsonify({"error": "validation_error", "message": "fileIds must be a list."}),
-            HTTPStatus.BAD_REQUEST,
-        )
-    else:
-        file_ids = []
-
-    if not uid:
-        return (
-            jsonify({"error": "validation_error", "message": "uid is required."}),
-            HTTPStatus.BAD_REQUEST,
-        )
-    if not content and not file_ids:
-        return (
-            jsonify(
-                {
-                    "error": "validation_error",
-                    "message": "content is required when no files are attached.",
-                }
-            ),
-            HTTPStatus.BAD_REQUEST,
-        )
-    if role not in {"user", "system"}:
-        return (
-            jsonify({"error": "validation_error", "message": "role must be 'user' or 'system'."}),
-            HTTPStatus.BAD_REQUEST,
-        )
-
-    try:
-        chat_ref, chat_data = _get_chat_for_user(chat_id, uid)
-    except FirestoreAccessError as exc:
-        return _firestore_error_response(exc)
-    if chat_ref is None:
-        return (
-            jsonify({"error": "not_found", "message": "Chat not found."}),
-            HTTPStatus.NOT_FOUND,
-        )
-    if chat_data is None:
-        return (
-            jsonify({"error": "forbidden", "message": "You do not have access to this chat."}),
-            HTTPStatus.FORBIDDEN,
-        )
-
-    attachments_data: dict[str, dict[str, Any]] = {}
-    if file_ids:
-        try:
-            attachments_data = _get_files_metadata(chat_ref, file_ids)
-        except FirestoreAccessError as exc:
-            return _firestore_error_response(exc)
-
-        missing = [fid for fid in file_ids if fid not in attachments_data]
-        if missing:
-            return (
-                jsonify(
-                    {
-                        "error": "validation_error",
-                        "message": "One or more files could not be found for this chat.",
-                        "missingFileIds": missing,
-                    }
-                ),
-                HTTPStatus.BAD_REQUEST,
-            )
-
-        unauthorised = [fid for fid, meta in attachments_data.items() if meta.get("uid") != uid]
-        if unauthorised:
-            return (
-                jsonify(
-                    {
-                        "error": "forbidden",
-                        "message": "You do not have access to one or more attached files.",
-                        "fileIds": unauthorised,
-                    }
-                ),
-                HTTPStatus.FORBIDDEN,
-            )
-
-    db = get_firestore_client()
-    messages_ref = chat_ref.collection("messages")
-    now = _now()
-
-    user_message_data = {
-        "uid": uid,
-        "role": role,
-        "content": content,
-        "createdAt": now,
-    }
-    if file_ids:
-        user_message_data["fileIds"] = file_ids
-
-    try:
-        user_message_ref = messages_ref.document()
-        user_message_ref.set(user_message_data)
-
-        chat_ref.update({"updatedAt": now})
-    except google_exceptions.PermissionDenied as exc:
-        return _firestore_error_response(exc)
-    except google_exceptions.GoogleAPICallError as exc:
-        return _firestore_error_response(exc)
-
-    ai_provider = current_app.config.get("AI_PROVIDER", "openrouter")
-    ai_api_key = current_app.config.get("AI_API_KEY")
-    ai_server_url = current_app.config.get("AI_SERVER_URL")
-    
-    # Fallback to legacy OPENROUTER_API_KEY if AI_API_KEY not set
-    if not ai_api_key:
-        if ai_provider == "openrouter":
-            ai_api_key = current_app.config.get("OPENROUTER_API_KEY")
-        elif ai_provider == "hackclub":
-            ai_api_key = current_app.config.get("OPENROUTER_API_KEY")  # Hack Club uses same key format
-    
+
+    if isinstance(raw_file_ids, list):
+        file_ids = []
+        for fid in raw_file_ids:
+            if not isinstance(fid, str):
+                return (
+                    jsonify({"error": "validation_error", "message": "fileIds must be a list of strings."}),
+                    HTTPStatus.BAD_REQUEST,
+                )
+            fid_clean = fid.strip()
+            if not fid_clean:
+                continue
+            if fid_clean not in file_ids:
+                file_ids.append(fid_clean)
+    elif raw_file_ids:
+        return (
+            jsonify({"error": "validation_error", "message": "fileIds must be a list."}),
+            HTTPStatus.BAD_REQUEST,
+        )
+    else:
+        file_ids = []
+
+    if not uid:
+        return (
+            jsonify({"error": "validation_error", "message": "uid is required."}),
+            HTTPStatus.BAD_REQUEST,
+        )
+    if not content and not file_ids:
+        return (
+            jsonify(
+                {
+                    "error": "validation_error",
+                    "message": "content is required when no files are attached.",
+                }
+            ),
+            HTTPStatus.BAD_REQUEST,
+        )
+    if role not in {"user", "system"}:
+        return (
+            jsonify({"error": "validation_error", "message": "role must be 'user' or 'system'."}),
+            HTTPStatus.BAD_REQUEST,
+        )
+
+    try:
+        chat_ref, chat_data = _get_chat_for_user(chat_id, uid)
+    except FirestoreAccessError as exc:
+        return _firestore_error_response(exc)
+    if chat_ref is None:
+        return (
+            jsonify({"error": "not_found", "message": "Chat not found."}),
+            HTTPStatus.NOT_FOUND,
+        )
+    if chat_data is None:
+        return (
+            jsonify({"error": "forbidden", "message": "You do not have access to this chat."}),
+            HTTPStatus.FORBIDDEN,
+        )
+
+    attachments_data: dict[str, dict[str, Any]] = {}
+    if file_ids:
+        try:
+            attachments_data = _get_files_metadata(chat_ref, file_ids)
+        except FirestoreAccessError as exc:
+            return _firestore_error_response(exc)
+
+        missing = [fid for fid in file_ids if fid not in attachments_data]
+        if missing:
+            return (
+                jsonify(
+                    {
+                        "error": "validation_error",
+                        "message": "One or more files could not be found for this chat.",
+                        "missingFileIds": missing,
+                    }
+                ),
+                HTTPStatus.BAD_REQUEST,
+            )
+
+        unauthorised = [fid for fid, meta in attachments_data.items() if meta.get("uid") != uid]
+        if unauthorised:
+            return (
+                jsonify(
+                    {
+                        "error": "forbidden",
+                        "message": "You do not have access to one or more attached files.",
+                        "fileIds": unauthorised,
+                    }
+                ),
+                HTTPStatus.FORBIDDEN,
+            )
+
+    db = get_firestore_client()
+    messages_ref = chat_ref.collection("messages")
+    now = _now()
+
+    user_message_data = {
+        "uid": uid,
+        "role": role,
+        "content": content,
+        "createdAt": now,
+    }
+    if file_ids:
+        user_message_data["fileIds"] = file_ids
+
+    try:
+        user_message_ref = messages_ref.document()
+        user_message_ref.set(user_message_data)
+        _append_history_record(chat_ref, user_message_ref.id, user_message_data)
+
+        chat_ref.update({"updatedAt": now})
+    except google_exceptions.PermissionDenied as exc:
+        return _firestore_error_response(exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        return _firestore_error_response(exc)
+
+    ai_provider = current_app.config.get("AI_PROVIDER", "openrouter")
+    ai_api_key = current_app.config.get("AI_API_KEY")
+    ai_server_url = current_app.config.get("AI_SERVER_URL")
+    
+    # Fallback to legacy OPENROUTER_API_KEY if AI_API_KEY not set
+    if not ai_api_key:
+        if ai_provider == "openrouter":
+            ai_api_key = current_app.config.get("OPENROUTER_API_KEY")
+        elif ai_provider == "hackclub":
+            ai_api_key = current_app.config.get("OPENROUTER_API_KEY")  # Hack Club uses same key format
+    
     if not ai_api_key:
         return (
             jsonify(
@@ -887,14 +1276,20 @@ def add_message(chat_id: str) -> tuple[Any, int]:
             HTTPStatus.SERVICE_UNAVAILABLE,
         )
 
-    available_models = None
+    # The pre-stream work is dominated by independent network round-trips
+    # (model list, Firestore history); dispatch them together so the wait is
+    # max(RTT) instead of the sum.
+    history_future = _TOOL_EXECUTOR.submit(_load_history_records, chat_ref)
+
     if requested_model:
+        models_future = _TOOL_EXECUTOR.submit(
+            list_available_model_ids,
+            api_key=ai_api_key,
+            provider=ai_provider,
+            server_url=ai_server_url,
+        )
         try:
-            available_models = list_available_models(
-                api_key=ai_api_key,
-                provider=ai_provider,
-                server_url=ai_server_url,
-            )
+            valid_model_ids = models_future.result()
         except GeminiAPIError as exc:
             return (
                 jsonify(
@@ -907,14 +1302,13 @@ def add_message(chat_id: str) -> tuple[Any, int]:
                 HTTPStatus.BAD_GATEWAY,
             )
 
-        valid_model_ids = {model_info.get("id") for model_info in available_models if model_info.get("id")}
         if requested_model not in valid_model_ids:
             return (
                 jsonify(
                     {
                         "error": "invalid_model",
                         "message": "Requested model is not available.",
-                        "availableModels": sorted(valid_model_ids),
+                        "availableModels": list(sorted_model_ids() or sorted(valid_model_ids)),
                         "userMessage": _serialize_message(user_message_ref.id, user_message_data),
                     }
                 ),
@@ -923,293 +1317,308 @@ def add_message(chat_id: str) -> tuple[Any, int]:
 
     accept_header = (request.headers.get("Accept") or "").lower()
     wants_stream = bool(payload.get("stream")) or "text/event-stream" in accept_header
-
-    history_query = messages_ref.order_by("createdAt")
-    try:
-        history_docs = list(history_query.stream())
-    except google_exceptions.PermissionDenied as exc:
-        return _firestore_error_response(exc)
-    except google_exceptions.GoogleAPICallError as exc:
-        return _firestore_error_response(exc)
-
-    history_messages = []
-    if chat_data.get("systemPrompt"):
-        history_messages.append({"role": "system", "content": chat_data["systemPrompt"]})
-
-    history_messages.append({"role": "system", "content": DEFAULT_SYSTEM_INSTRUCTION})
-
-    files_cache = dict(attachments_data)
-
-    history_records: list[tuple[str, dict[str, Any]]] = []
-    for doc in history_docs:
-        data = doc.to_dict() or {}
-        history_records.append((doc.id, data))
-
-    additional_file_ids: set[str] = set()
-    for _, data in history_records:
-        for fid in data.get("fileIds", []) or []:
-            if isinstance(fid, str) and fid and fid not in files_cache:
-                additional_file_ids.add(fid)
-
-    if additional_file_ids:
-        try:
-            extra_files = _get_files_metadata(chat_ref, additional_file_ids)
-        except FirestoreAccessError as exc:
-            return _firestore_error_response(exc)
-        files_cache.update(extra_files)
-
-    for _, data in history_records:
-        message_file_ids = [fid for fid in (data.get("fileIds", []) or []) if isinstance(fid, str) and fid]
-        message_content = _compose_message_content(data.get("content", ""), message_file_ids, files_cache)
-        message_parts = _prepare_message_parts(message_content, message_file_ids, files_cache)
-        history_messages.append(
-            {
-                "role": data.get("role", "user"),
-                "content": message_content,
-                "parts": message_parts,
-            }
-        )
-
-    latest_user_text = next(
-        (msg.get("content", "") for msg in reversed(history_messages) if msg.get("role") == "user" and msg.get("content")),
-        "",
-    )
-
-    note_context_blocks: list[str] = []
-    if latest_user_text:
-        context_notes = find_notes_for_text(uid, latest_user_text, limit=5)
-        for note in context_notes:
-            block = format_note_for_context(note)
-            if block:
-                note_context_blocks.append(block)
-
-    if note_context_blocks:
-        history_messages.append(
-            {
-                "role": "system",
-                "content": (
-                    "The following stored user notes may be relevant to this conversation. "
-                    "Treat them as ground-truth context about the user and keep them confidential unless the user explicitly asks you to share them.\n\n"
-                    + "\n\n".join(note_context_blocks)
-                ),
-            }
-        )
-
-    if latest_user_text:
-        language_instruction = (
-            "Respond in the same language as the most recent user message. Mirror the language used here without translating unless asked."
-        )
-    else:
-        language_instruction = (
-            "Respond in the same language as the most recent user message when it exists. If the language is unclear, ask the user to clarify before answering."
-        )
-    history_messages.append({"role": "system", "content": language_instruction})
-
-    if wants_stream:
-        serialized_user = _serialize_message(user_message_ref.id, user_message_data)
-
-        def event_stream():
-            yield _sse_message({"type": "user_message", "message": serialized_user})
-
-            try:
+
+    try:
+        history_records = history_future.result()
+    except google_exceptions.PermissionDenied as exc:
+        return _firestore_error_response(exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        return _firestore_error_response(exc)
+
+    history_messages = []
+    if chat_data.get("systemPrompt"):
+        history_messages.append({"role": "system", "content": chat_data["systemPrompt"]})
+
+    history_messages.append(_DEFAULT_SYS_MSG)
+
+    files_cache = dict(attachments_data)
+
+    # Normalize each record's file ids in one pass; the set difference below
+    # and the composition loop both reuse the results.
+    history_entries: list[tuple[str, dict[str, Any], list[str]]] = []
+    all_file_ids: set[str] = set()
+    for doc_id, data in history_records:
+        normalized_fids = [fid for fid in (data.get("fileIds") or ()) if isinstance(fid, str) and fid]
+        if normalized_fids:
+            all_file_ids.update(normalized_fids)
+        history_entries.append((doc_id, data, normalized_fids))
+
+    additional_file_ids = all_file_ids - files_cache.keys()
+
+    # The notes lookup only needs the raw text of the latest user message, so
+    # it can overlap with the extra attachment-metadata fetch below.
+    latest_user_raw = next(
+        (
+            data.get("content")
+            for _, data in reversed(history_records)
+            if data.get("role", "user") == "user" and data.get("content")
+        ),
+        "",
+    )
+    notes_future = (
+        _TOOL_EXECUTOR.submit(_find_notes_cached, uid, latest_user_raw)
+        if latest_user_raw
+        else None
+    )
+
+    if additional_file_ids:
+        try:
+            extra_files = _get_files_metadata(chat_ref, additional_file_ids)
+        except FirestoreAccessError as exc:
+            return _firestore_error_response(exc)
+        files_cache.update(extra_files)
+
+    # History is assembled in order, so track the latest user text as we go
+    # instead of re-walking the list afterwards.
+    latest_user_text = ""
+    for doc_id, data, message_file_ids in history_entries:
+        message_content, message_parts = _composed_message(doc_id, data, message_file_ids, files_cache)
+        role = data.get("role", "user")
+        if role == "user" and message_content:
+            latest_user_text = message_content
+        history_messages.append(
+            {
+                "role": role,
+                "content": message_content,
+                "parts": message_parts,
+            }
+        )
+
+    note_context_blocks: list[str] = []
+    if notes_future is not None:
+        for note in notes_future.result():
+            block = format_note_for_context(note)
+            if block:
+                note_context_blocks.append(block)
+
+    if note_context_blocks:
+        history_messages.append(
+            {
+                "role": "system",
+                "content": (
+                    "The following stored user notes may be relevant to this conversation. "
+                    "Treat them as ground-truth context about the user and keep them confidential unless the user explicitly asks you to share them.\n\n"
+                    + "\n\n".join(note_context_blocks)
+                ),
+            }
+        )
+
+    history_messages.append(_LANG_MSG_WITH_TEXT if latest_user_text else _LANG_MSG_NO_TEXT)
+
+    if wants_stream:
+        serialized_user = _serialize_message(user_message_ref.id, user_message_data)
+
+        def event_stream():
+            yield _sse_message({"type": "user_message", "message": serialized_user})
+
+            try:
                 stream_ctx = stream_reply(
                     history_messages,
                     api_key=ai_api_key,
                     model=requested_model or DEFAULT_MODEL,
-                    tools=NOTES_TOOLS,
+                    tools=NOTES_TOOLS_CACHED_JSON,
+                    server_url=ai_server_url,
+                )
+            except GeminiAPIError as exc:
+                yield _sse_message({"type": "error", "message": str(exc), "error": "ai_error"})
+                return
+
+            aggregated_chunks: list[str] = []
+            final_response: Any | None = None
+            tool_calls_detected: list[dict[str, Any]] = []
+            extract_text: Any | None = None
+            merger = _TokenMerger()
+            # OpenRouter stream yields objects with choices -> [delta with content]
+            try:
+                for event in stream_ctx:
+                    if extract_text is None:
+                        extract_text = _select_text_extractor(event)
+                    text_chunk, function_calls = _parse_stream_event(event, extract_text)
+                    if function_calls:
+                        tool_calls_detected.extend(function_calls)
+                        continue  # Don't stream text when we have tool calls
+                    if not text_chunk:
+                        continue
+                    aggregated_chunks.append(text_chunk)
+                    # Send only the delta; re-joining the whole reply per chunk
+                    # is quadratic and the client accumulates tokens itself.
+                    merged = merger.add(text_chunk)
+                    if merged is not None:
+                        yield _sse_token_frame(merged)
+            except GeminiAPIError as exc:
+                yield _sse_message({"type": "error", "message": str(exc), "error": "ai_error"})
+                return
+            except Exception as exc:
+                log.exception("OpenRouter streaming error: %s", exc)
+                yield _sse_message(
+                    {
+                        "type": "error",
+                        "message": "OpenRouter streaming failed.",
+                        "detail": str(exc),
+                        "error": "streaming_error",
+                    }
+                )
+                return
+
+            tail = merger.flush()
+            if tail is not None:
+                yield _sse_token_frame(tail)
+
+            final_text = "".join(aggregated_chunks).strip()
+            if not final_text:
+                yield _sse_message(
+                    {
+                        "type": "error",
+                        "message": "OpenRouter API returned an empty response.",
+                        "error": "ai_empty",
+                    }
+                )
+                return
+
+            created_at = _now()
+            chat_title = (chat_data.get("title") or "").strip()
+            should_update_title = chat_title.lower() in {"", "new chat"}
+            title_future = None
+            if should_update_title:
+                # The title LLM call has no dependency on the Firestore write;
+                # start it now so both overlap.
+                user_prompt_for_title = user_message_data.get("content", "") or latest_user_text
+                title_future = _TOOL_EXECUTOR.submit(
+                    generate_chat_title,
+                    user_message=user_prompt_for_title,
+                    assistant_message=final_text,
+                    api_key=ai_api_key,
+                    model=requested_model or DEFAULT_MODEL,
                     server_url=ai_server_url,
                 )
-            except GeminiAPIError as exc:
-                yield _sse_message({"type": "error", "message": str(exc), "error": "ai_error"})
-                return
-
-            aggregated_chunks: list[str] = []
-            final_response: Any | None = None
-            tool_calls_detected: list[dict[str, Any]] = []
-            # OpenRouter stream yields objects with choices -> [delta with content]
-            try:
-                for event in stream_ctx:
-                    # Check for function calls in this event (if supported)
-                    function_calls = _extract_function_calls_from_response(event)
-                    if function_calls:
-                        tool_calls_detected.extend(function_calls)
-                        continue  # Don't stream text when we have tool calls
-                    text_chunk = _extract_text_from_event(event)
-                    if not text_chunk:
-                        continue
-                    aggregated_chunks.append(text_chunk)
-                    yield _sse_message(
-                        {
-                            "type": "token",
-                            "token": text_chunk,
-                            "text": "".join(aggregated_chunks),
-                        }
-                    )
-            except GeminiAPIError as exc:
-                yield _sse_message({"type": "error", "message": str(exc), "error": "ai_error"})
-                return
-            except Exception as exc:
-                log.exception("OpenRouter streaming error: %s", exc)
-                yield _sse_message(
-                    {
-                        "type": "error",
-                        "message": "OpenRouter streaming failed.",
-                        "detail": str(exc),
-                        "error": "streaming_error",
-                    }
-                )
-                return
-
-            final_text = "".join(aggregated_chunks).strip()
-            if not final_text:
-                yield _sse_message(
-                    {
-                        "type": "error",
-                        "message": "OpenRouter API returned an empty response.",
-                        "error": "ai_empty",
-                    }
-                )
-                return
-
-            created_at = _now()
-            ai_message_data = {
-                "uid": uid,
-                "role": "assistant",
-                "content": final_text,
-                "createdAt": created_at,
-            }
-            try:
-                ai_message_ref = messages_ref.document()
-                ai_message_ref.set(ai_message_data)
-                chat_ref.update({"updatedAt": created_at})
-            except google_exceptions.PermissionDenied as exc:
-                yield _sse_message(
-                    {
-                        "type": "error",
-                        "message": "Unable to store assistant message.",
-                        "detail": str(exc),
-                        "error": "firestore_permission",
-                    }
-                )
-                return
-            except google_exceptions.GoogleAPICallError as exc:
-                yield _sse_message(
-                    {
-                        "type": "error",
-                        "message": "Unable to store assistant message.",
-                        "detail": str(exc),
-                        "error": "firestore_unavailable",
-                    }
-                )
-                return
-            serialized_assistant = _serialize_message(ai_message_ref.id, ai_message_data)
-            yield _sse_message({"type": "assistant_message", "message": serialized_assistant})
-            chat_title = (chat_data.get("title") or "").strip()
-            default_titles = {"", "new chat"}
-            should_update_title = chat_title.lower() in default_titles
-            updated_title: str | None = None
-            if should_update_title:
-                user_prompt_for_title = user_message_data.get("content", "") or latest_user_text
-                try:
-                    updated_title = generate_chat_title(
-                        user_message=user_prompt_for_title,
-                        assistant_message=final_text,
-                        api_key=ai_api_key,
-                        model=requested_model or DEFAULT_MODEL,
-                        server_url=ai_server_url,
-                    )
-                except GeminiAPIError as exc:
-                    log.warning("Unable to generate chat title: %s", exc)
-            if updated_title:
-                try:
-                    chat_ref.update({
-                        "title": updated_title,
-                        "updatedAt": created_at,
-                    })
-                    chat_data["title"] = updated_title
-                    yield _sse_message({"type": "chat_title", "title": updated_title})
-                except google_exceptions.PermissionDenied as exc:
-                    log.warning("Failed to persist chat title: %s", exc)
-                except google_exceptions.GoogleAPICallError as exc:
-                    log.warning("Failed to persist chat title: %s", exc)
-            yield _sse_message({"type": "done"})
-
-        response = Response(stream_with_context(event_stream()), mimetype="text/event-stream")
-        response.headers["Cache-Control"] = "no-cache"
-        response.headers["X-Accel-Buffering"] = "no"
-        return response
-
-    try:
+            ai_message_data = {
+                "uid": uid,
+                "role": "assistant",
+                "content": final_text,
+                "createdAt": created_at,
+            }
+            try:
+                ai_message_ref = messages_ref.document()
+                # One batched commit instead of two serial RPCs on the
+                # critical "done" path.
+                batch = db.batch()
+                batch.set(ai_message_ref, ai_message_data)
+                batch.update(chat_ref, {"updatedAt": created_at})
+                batch.commit()
+                _append_history_record(chat_ref, ai_message_ref.id, ai_message_data)
+            except google_exceptions.PermissionDenied as exc:
+                yield _sse_message(
+                    {
+                        "type": "error",
+                        "message": "Unable to store assistant message.",
+                        "detail": str(exc),
+                        "error": "firestore_permission",
+                    }
+                )
+                return
+            except google_exceptions.GoogleAPICallError as exc:
+                yield _sse_message(
+                    {
+                        "type": "error",
+                        "message": "Unable to store assistant message.",
+                        "detail": str(exc),
+                        "error": "firestore_unavailable",
+                    }
+                )
+                return
+            serialized_assistant = _serialize_message(ai_message_ref.id, ai_message_data)
+            yield _sse_message({"type": "assistant_message", "message": serialized_assistant})
+            updated_title: str | None = None
+            if title_future is not None:
+                try:
+                    updated_title = title_future.result()
+                except GeminiAPIError as exc:
+                    log.warning("Unable to generate chat title: %s", exc)
+            if updated_title:
+                try:
+                    chat_ref.update({
+                        "title": updated_title,
+                        "updatedAt": created_at,
+                    })
+                    chat_data["title"] = updated_title
+                    yield _sse_message({"type": "chat_title", "title": updated_title})
+                except google_exceptions.PermissionDenied as exc:
+                    log.warning("Failed to persist chat title: %s", exc)
+                except google_exceptions.GoogleAPICallError as exc:
+                    log.warning("Failed to persist chat title: %s", exc)
+            yield _sse_message({"type": "done"})
+
+        response = Response(
+            stream_with_context(_coalesce_sse(event_stream())), mimetype="text/event-stream"
+        )
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    try:
         ai_reply, _ = generate_reply(
             history_messages,
             api_key=ai_api_key,
             model=requested_model or DEFAULT_MODEL,
             server_url=ai_server_url,
         )
-    except GeminiAPIError as exc:
-        return (
-            jsonify(
-                {
-                    "error": "ai_error",
-                    "message": str(exc),
-                    "userMessage": _serialize_message(user_message_ref.id, user_message_data),
-                }
-            ),
-            HTTPStatus.BAD_GATEWAY,
-        )
-
-    ai_message_data = {
-        "uid": uid,
-        "role": "assistant",
-        "content": ai_reply,
-        "createdAt": _now(),
-    }
-
-    try:
-        ai_message_ref = messages_ref.document()
-        ai_message_ref.set(ai_message_data)
-        chat_ref.update({"updatedAt": ai_message_data["createdAt"]})
-    except google_exceptions.PermissionDenied as exc:
-        return _firestore_error_response(exc)
-    except google_exceptions.GoogleAPICallError as exc:
-        return _firestore_error_response(exc)
-
-    chat_title = (chat_data.get("title") or "").strip()
-    default_titles = {"", "new chat"}
-    should_update_title = chat_title.lower() in default_titles
-    updated_title: str | None = None
-
-    if should_update_title:
-        user_prompt_for_title = user_message_data.get("content", "") or latest_user_text
-        try:
-            updated_title = generate_chat_title(
-                user_message=user_prompt_for_title,
-                assistant_message=ai_reply,
-                api_key=ai_api_key,
-                model=requested_model or DEFAULT_MODEL,
-                server_url=ai_server_url,
-            )
-        except GeminiAPIError as exc:
-            log.warning("Unable to generate chat title: %s", exc)
-
-    if updated_title:
-        try:
-            chat_ref.update({
-                "title": updated_title,
-                "updatedAt": ai_message_data["createdAt"],
-            })
-            chat_data["title"] = updated_title
-        except google_exceptions.PermissionDenied as exc:
-            log.warning("Failed to persist chat title: %s", exc)
-        except google_exceptions.GoogleAPICallError as exc:
-            log.warning("Failed to persist chat title: %s", exc)
-
-    return (
-        jsonify(
-            {
-                "userMessage": _serialize_message(user_message_ref.id, user_message_data),
-                "assistantMessage": _serialize_message(ai_message_ref.id, ai_message_data),
-            }
-        ),
-        HTTPStatus.CREATED,
-    )
+    except GeminiAPIError as exc:
+        return (
+            jsonify(
+                {
+                    "error": "ai_error",
+                    "message": str(exc),
+                    "userMessage": _serialize_message(user_message_ref.id, user_message_data),
+                }
+            ),
+            HTTPStatus.BAD_GATEWAY,
+        )
+
+    ai_message_data = {
+        "uid": uid,
+        "role": "assistant",
+        "content": ai_reply,
+        "createdAt": _now(),
+    }
+
+    try:
+        ai_message_ref = messages_ref.document()
+        batch = db.batch()
+        batch.set(ai_message_ref, ai_message_data)
+        batch.update(chat_ref, {"updatedAt": ai_message_data["createdAt"]})
+        batch.commit()
+        _append_history_record(chat_ref, ai_message_ref.id, ai_message_data)
+    except google_exceptions.PermissionDenied as exc:
+        return _firestore_error_response(exc)
+    except google_exceptions.GoogleAPICallError as exc:
+        return _firestore_error_response(exc)
+
+    chat_title = (chat_data.get("title") or "").strip()
+    default_titles = {"", "new chat"}
+    should_update_title = chat_title.lower() in default_titles
+
+    if should_update_title:
+        # The response does not include the title, so generate and persist it
+        # in the background instead of holding the request for another LLM
+        # round-trip.
+        user_prompt_for_title = user_message_data.get("content", "") or latest_user_text
+        _TOOL_EXECUTOR.submit(
+            _generate_and_store_title,
+            chat_ref,
+            user_prompt_for_title,
+            ai_reply,
+            ai_api_key,
+            requested_model or DEFAULT_MODEL,
+            ai_server_url,
+            ai_message_data["createdAt"],
+        )
+
+    return (
+        jsonify(
+            {
+                "userMessage": _serialize_message(user_message_ref.id, user_message_data),
+                "assistantMessage": _serialize_message(ai_message_ref.id, ai_message_data),
+            }
+        ),
+        HTTPStatus.CREATED,
+    )
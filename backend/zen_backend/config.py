@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 import os
 from dataclasses import dataclass
 from pathlib import Path
@@ -9,6 +10,9 @@ import re
 from dotenv import load_dotenv
 
 
+_SCOPE_SPLIT_RE = re.compile(r"[\s,]+")
+
+
 class ConfigError(Exception):
     """Raised when required configuration is missing or invalid."""
 
@@ -37,7 +41,10 @@ class AppConfig:
     ai_api_key: Optional[str] = None
 
 
+@functools.lru_cache(maxsize=64)
 def _resolve_path(path_str: str, base_dir: Path) -> Path:
+    # Memoized: each resolution can cost several stat calls, and the same
+    # paths are re-resolved on every config load.
     # Normalize Windows-style backslashes to forward slashes so paths work across OSes.
     path_str = path_str.strip().replace("\\", "/")
     candidate = Path(path_str).expanduser()
@@ -127,29 +134,17 @@ def load_config() -> AppConfig:
     google_client_id = os.getenv("GOOGLE_CLIENT_ID")
     google_client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
     scopes_raw = os.getenv("GOOGLE_CALENDAR_SCOPES", "")
-    scope_tokens: list[str] = []
-    if scopes_raw:
-        for token in re.split(r"[\s,]+", scopes_raw):
-            token_clean = token.strip()
-            if token_clean:
-                scope_tokens.append(token_clean)
-    if not scope_tokens:
-        scope_tokens = ["https://www.googleapis.com/auth/calendar.events"]
-    google_calendar_scopes = tuple(scope_tokens)
+    google_calendar_scopes = tuple(t for t in _SCOPE_SPLIT_RE.split(scopes_raw) if t) if scopes_raw else ()
+    if not google_calendar_scopes:
+        google_calendar_scopes = ("https://www.googleapis.com/auth/calendar.events",)
 
     gmail_scopes_raw = os.getenv("GOOGLE_GMAIL_SCOPES", "")
-    gmail_scope_tokens: list[str] = []
-    if gmail_scopes_raw:
-        for token in re.split(r"[\s,]+", gmail_scopes_raw):
-            token_clean = token.strip()
-            if token_clean:
-                gmail_scope_tokens.append(token_clean)
-    if not gmail_scope_tokens:
-        gmail_scope_tokens = [
+    google_gmail_scopes = tuple(t for t in _SCOPE_SPLIT_RE.split(gmail_scopes_raw) if t) if gmail_scopes_raw else ()
+    if not google_gmail_scopes:
+        google_gmail_scopes = (
             "https://www.googleapis.com/auth/gmail.readonly",
             "https://www.googleapis.com/auth/gmail.send",
-        ]
-    google_gmail_scopes = tuple(gmail_scope_tokens)
+        )
 
     gmail_pubsub_topic = os.getenv("GMAIL_PUBSUB_TOPIC")
 
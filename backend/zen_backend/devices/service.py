@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 import hashlib
+import hmac
 import logging
 import secrets
+import threading
+import time
 import uuid
 
 from firebase_admin import firestore as firebase_firestore
@@ -22,7 +26,7 @@ from ..email.service import (
     GmailConfig,
     GmailService,
 )
-from ..email.analyzer import list_analyses
+from ..email.analyzer import list_high_importance_analyses
 
 log = logging.getLogger(__name__)
 
@@ -69,8 +73,18 @@ def _collection():
     return get_firestore_client().collection("devices")
 
 
+def _pairing_tokens():
+    # Pointer docs keyed by pairing-token hash: claiming resolves the token
+    # with one keyed get instead of an indexed where() query.
+    return get_firestore_client().collection("devicePairingTokens")
+
+
+# Bound once: skips the module-attribute lookup on each registration/auth.
+_sha256 = hashlib.sha256
+
+
 def _hash(value: str) -> str:
-    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+    return _sha256(value.encode("utf-8")).hexdigest()
 
 
 def _coerce_timestamp(value: Any) -> Optional[datetime]:
@@ -87,7 +101,7 @@ def register_device(*, hardware_id: str | None, firmware_version: str | None = N
     device_id = uuid.uuid4().hex
     pairing_token = secrets.token_urlsafe(9)
     device_secret = secrets.token_urlsafe(24)
-    bluetooth_name = f"ZenDisplay-{device_id[-4:].upper()}"
+    bluetooth_name = "ZenDisplay-" + device_id[-4:].upper()
 
     payload = {
         "deviceId": device_id,
@@ -104,7 +118,14 @@ def register_device(*, hardware_id: str | None, firmware_version: str | None = N
         "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
     }
 
-    _collection().document(device_id).set(payload)
+    db = get_firestore_client()
+    batch = db.batch()
+    batch.set(_collection().document(device_id), payload)
+    batch.set(
+        _pairing_tokens().document(payload["pairingTokenHash"]),
+        {"deviceId": device_id, "expiresAt": payload["pairingTokenExpiresAt"]},
+    )
+    batch.commit()
 
     return {
         "deviceId": device_id,
@@ -122,13 +143,21 @@ def claim_device(*, pairing_token: str, owner_uid: str) -> dict[str, Any]:
         raise DeviceError("pairing_token is required")
 
     hashed = _hash(pairing_token)
-    matches = (
-        _collection()
-        .where("pairingTokenHash", "==", hashed)
-        .limit(1)
-        .stream()
-    )
-    snapshot = next(matches, None)
+    pointer_ref = _pairing_tokens().document(hashed)
+    pointer = pointer_ref.get()
+    if pointer.exists:
+        device_id = (pointer.to_dict() or {}).get("deviceId")
+        snapshot = _collection().document(device_id).get() if device_id else None
+    else:
+        # Devices registered before pointer docs existed are still found via
+        # the indexed query.
+        matches = (
+            _collection()
+            .where("pairingTokenHash", "==", hashed)
+            .limit(1)
+            .stream()
+        )
+        snapshot = next(matches, None)
     if snapshot is None or not snapshot.exists:
         raise DeviceNotFound("Pairing token not found")
 
@@ -148,7 +177,10 @@ def claim_device(*, pairing_token: str, owner_uid: str) -> dict[str, Any]:
         "updatedAt": firebase_firestore.SERVER_TIMESTAMP,
         "claimedAt": firebase_firestore.SERVER_TIMESTAMP,
     }
-    snapshot.reference.set(updates, merge=True)
+    batch = get_firestore_client().batch()
+    batch.set(snapshot.reference, updates, merge=True)
+    batch.delete(pointer_ref)
+    batch.commit()
 
     return {
         "deviceId": snapshot.id,
@@ -178,15 +210,114 @@ def get_device(device_id: str) -> DeviceRecord:
     )
 
 
+# Fields the auth/presence/state paths actually read; the projected get below
+# skips transferring and deserializing the rest of the document.
+_AUTH_FIELD_PATHS = ("deviceSecretHash", "ownerUid", "status", "bluetoothName")
+
+
+def get_device_for_auth(device_id: str) -> DeviceRecord:
+    """Projected variant of :func:`get_device` for the hot auth path."""
+    doc = _collection().document(device_id).get(field_paths=_AUTH_FIELD_PATHS)
+    if not doc.exists:
+        raise DeviceNotFound("Device not registered")
+    data = doc.to_dict() or {}
+    return DeviceRecord(
+        id=device_id,
+        hardware_id=None,
+        owner_uid=data.get("ownerUid"),
+        status=data.get("status", "pending"),
+        bluetooth_name=data.get("bluetoothName"),
+        firmware_version=None,
+        device_secret_hash=data.get("deviceSecretHash", ""),
+        pairing_token_hash=None,
+        pairing_token_expires_at=None,
+        last_seen_at=None,
+        created_at=None,
+        updated_at=None,
+    )
+
+
+# Devices heartbeat every few seconds; a short-lived cache keyed by the secret
+# digest turns the per-request Firestore lookup into a dict hit. Only the
+# digest is kept, never the secret.
+_AUTH_CACHE_TTL_SECONDS = 30
+_AUTH_CACHE_MAX_ENTRIES = 4096
+_auth_cache: dict[tuple[str, bytes], tuple[float, DeviceRecord]] = {}
+_auth_cache_lock = threading.Lock()
+
+
 def authenticate_device(device_id: str, device_secret: str) -> DeviceRecord:
-    record = get_device(device_id)
     if not device_secret:
         raise DeviceAuthError("Missing device secret")
-    if record.device_secret_hash != _hash(device_secret):
+
+    # blake2b is measurably faster than sha256 for short inputs and this key
+    # is computed on every heartbeat; 16 bytes of digest is plenty here.
+    key = (device_id, hashlib.blake2b(device_secret.encode("utf-8"), digest_size=16).digest())
+    now = time.time()
+    with _auth_cache_lock:
+        cached = _auth_cache.get(key)
+        if cached is not None:
+            cached_until, record = cached
+            if now < cached_until:
+                return record
+            del _auth_cache[key]
+
+    record = get_device_for_auth(device_id)
+    if not hmac.compare_digest(record.device_secret_hash, _hash(device_secret)):
         raise DeviceAuthError("Invalid device credentials")
+
+    with _auth_cache_lock:
+        if len(_auth_cache) >= _AUTH_CACHE_MAX_ENTRIES:
+            _auth_cache.clear()
+        _auth_cache[key] = (now + _AUTH_CACHE_TTL_SECONDS, record)
     return record
 
 
+# Presence writes are coalesced per device and flushed by a background thread:
+# bursty heartbeats would otherwise issue one Firestore write (and RTT) each
+# and run into the per-document write-rate limit. Fields merge last-write-wins
+# and the flush lag is bounded by the interval below.
+_PRESENCE_FLUSH_SECONDS = 0.5
+_presence_buffer: dict[str, dict[str, Any]] = {}
+_presence_lock = threading.Lock()
+_presence_flusher_started = False
+
+
+def _flush_presence_buffer() -> None:
+    with _presence_lock:
+        if not _presence_buffer:
+            return
+        pending = dict(_presence_buffer)
+        _presence_buffer.clear()
+
+    db = get_firestore_client()
+    batch = db.batch()
+    for device_id, updates in pending.items():
+        batch.set(_collection().document(device_id), updates, merge=True)
+    try:
+        batch.commit()
+    except Exception as exc:
+        log.warning("Presence flush failed: %s", exc)
+
+
+def _presence_flusher() -> None:
+    while True:
+        time.sleep(_PRESENCE_FLUSH_SECONDS)
+        _flush_presence_buffer()
+
+
+def _ensure_presence_flusher() -> None:
+    global _presence_flusher_started
+    if _presence_flusher_started:
+        return
+    with _presence_lock:
+        if _presence_flusher_started:
+            return
+        thread = threading.Thread(target=_presence_flusher, name="presence-flusher", daemon=True)
+        thread.start()
+        _presence_flusher_started = True
+
+
 def update_device_presence(
     record: DeviceRecord,
     *,
@@ -208,15 +339,33 @@ def update_device_presence(
     if firmware_version is not None:
         updates["firmwareVersion"] = firmware_version
 
-    _collection().document(record.id).set(updates, merge=True)
+    _ensure_presence_flusher()
+    with _presence_lock:
+        buffered = _presence_buffer.get(record.id)
+        if buffered is None:
+            _presence_buffer[record.id] = updates
+        else:
+            buffered.update(updates)
+
+
+# The calendar and email snapshots are independent per-uid I/O; one runs on a
+# worker so the state refresh takes max(latency) instead of the sum.
+_STATE_EXECUTOR = ThreadPoolExecutor(max_workers=4)
 
 
 def get_device_state(record: DeviceRecord) -> dict[str, Any]:
     if not record.owner_uid:
         raise DeviceUnclaimed("Device has not been paired to a user")
 
-    calendar_state = _get_calendar_snapshot(record.owner_uid)
-    email_state = _get_email_snapshot(record.owner_uid)
+    # Services are built on the request thread; the snapshot helpers only do
+    # context-free I/O, so they are safe to run on the executor.
+    calendar_service = _build_calendar_service()
+    email_service = _build_email_service()
+    calendar_future = _STATE_EXECUTOR.submit(
+        _get_calendar_snapshot, record.owner_uid, calendar_service
+    )
+    email_state = _get_email_snapshot(record.owner_uid, email_service)
+    calendar_state = calendar_future.result()
 
     return {
         "calendar": calendar_state,
@@ -225,21 +374,33 @@ def get_device_state(record: DeviceRecord) -> dict[str, Any]:
 
 
 def _build_calendar_service() -> GoogleCalendarService:
+    # Reuse one service (and its pooled HTTP session/token cache) per app,
+    # mirroring the calendar blueprint's extensions cache.
+    service: GoogleCalendarService | None = current_app.extensions.get("zen_device_calendar_service")
+    if service is not None:
+        return service
     config = GoogleCalendarConfig(
         client_id=current_app.config.get("GOOGLE_CLIENT_ID"),
         client_secret=current_app.config.get("GOOGLE_CLIENT_SECRET"),
         scopes=tuple(current_app.config.get("GOOGLE_CALENDAR_SCOPES") or ()),
     )
-    return GoogleCalendarService(config=config)
+    service = GoogleCalendarService(config=config)
+    current_app.extensions["zen_device_calendar_service"] = service
+    return service
 
 
 def _build_email_service() -> GmailService:
+    service: GmailService | None = current_app.extensions.get("zen_device_email_service")
+    if service is not None:
+        return service
     config = GmailConfig(
         client_id=current_app.config.get("GOOGLE_CLIENT_ID"),
         client_secret=current_app.config.get("GOOGLE_CLIENT_SECRET"),
         scopes=tuple(current_app.config.get("GOOGLE_GMAIL_SCOPES") or ()),
     )
-    return GmailService(config=config)
+    service = GmailService(config=config)
+    current_app.extensions["zen_device_email_service"] = service
+    return service
 
 
 def _normalize_event_time(event_time: dict[str, Any] | None) -> Optional[str]:
@@ -251,8 +412,7 @@ def _normalize_event_time(event_time: dict[str, Any] | None) -> Optional[str]:
     return str(date_time)
 
 
-def _get_calendar_snapshot(uid: str) -> dict[str, Any]:
-    service = _build_calendar_service()
+def _get_calendar_snapshot(uid: str, service: GoogleCalendarService) -> dict[str, Any]:
     connection = service.get_connection_state(uid)
     if connection is None:
         return {"connected": False, "items": []}
@@ -285,35 +445,47 @@ def _get_calendar_snapshot(uid: str) -> dict[str, Any]:
     return {"connected": True, "items": items}
 
 
-def _get_email_snapshot(uid: str) -> dict[str, Any]:
-    service = _build_email_service()
+def _get_email_snapshot(uid: str, service: GmailService) -> dict[str, Any]:
     connection = service.get_connection_state(uid)
     if connection is None:
         return {"connected": False, "items": []}
 
     try:
-        analyses = list_analyses(uid, limit=50)
+        # Firestore filters and caps importance server-side instead of pulling
+        # 50 analyses to keep 3.
+        analyses = list_high_importance_analyses(uid, threshold=4, limit=3)
     except Exception as exc:
         log.warning("Email analysis snapshot failed: %%s", exc)
         return {"connected": False, "error": str(exc)}
 
     analyses_by_message_id = {}
     for analysis in analyses:
-        importance = analysis.get("importance", 0)
-        if importance >= 4:
-            message_id = analysis.get("messageId")
-            if message_id:
-                analyses_by_message_id[message_id] = analysis
+        message_id = analysis.get("messageId")
+        if message_id and message_id not in analyses_by_message_id:
+            analyses_by_message_id[message_id] = analysis
 
     if not analyses_by_message_id:
         return {"connected": True, "items": []}
 
-    details = []
-    for message_id, analysis in list(analyses_by_message_id.items())[:3]:
+    top = list(analyses_by_message_id.items())[:3]
+
+    def _safe_get(message_id: str) -> dict[str, Any] | None:
         try:
-            full = service.get_message(uid, message_id)
+            return service.get_message(uid, message_id)
         except EmailError as exc:
             log.debug("Skipping email %%s due to error: %%s", message_id, exc)
+            return None
+
+    if len(top) > 1:
+        # Gmail handles concurrent GETs fine; fetch the top messages in
+        # parallel and keep importance order by zipping the results back.
+        fulls = list(_STATE_EXECUTOR.map(_safe_get, [mid for mid, _ in top]))
+    else:
+        fulls = [_safe_get(mid) for mid, _ in top]
+
+    details = []
+    for (message_id, analysis), full in zip(top, fulls):
+        if full is None:
             continue
         details.append(
             {
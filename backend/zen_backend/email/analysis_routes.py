@@ -4,10 +4,11 @@ from functools import wraps
 from http import HTTPStatus
 from typing import Any
 
-from flask import Blueprint, current_app, jsonify, request
+import orjson
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 
 from ..auth.utils import AuthError, require_firebase_user
-from .analyzer import analyze_email, get_analysis, get_user_categories, list_analyses, EmailAnalysisError
+from .analyzer import analyze_email, get_analysis, get_user_categories, iter_analyses, EmailAnalysisError
 
 analysis_bp = Blueprint("email_analysis", __name__, url_prefix="/email/analysis")
 
@@ -25,37 +26,49 @@ def _analysis_endpoint(fn):
     return wrapper
 
 
+def _serialize_analysis_dict(record: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": record.get("id"),
+        "messageId": record.get("messageId"),
+        "provider": record.get("provider"),
+        "importance": record.get("importance"),
+        "categories": record.get("categories"),
+        "senderSummary": record.get("senderSummary"),
+        "senderValidated": record.get("senderValidated"),
+        "contentSummary": record.get("contentSummary"),
+        "extractedInfo": record.get("extractedInfo"),
+        "matchedNoteIds": record.get("matchedNoteIds"),
+        "createdNoteId": record.get("createdNoteId"),
+    }
+
+
+def _serialize_analysis_obj(record: Any) -> dict[str, Any]:
+    return {
+        "id": f"{record.uid}_{record.provider}_{record.message_id}",
+        "messageId": record.message_id,
+        "provider": record.provider,
+        "importance": record.importance,
+        "categories": record.categories,
+        "senderSummary": record.sender_summary,
+        "senderValidated": record.sender_validated,
+        "contentSummary": record.content_summary,
+        "extractedInfo": record.extracted_info,
+        "matchedNoteIds": record.matched_note_ids,
+        "createdNoteId": record.created_note_id,
+    }
+
+
 def _serialize_analysis(record: dict[str, Any] | Any) -> dict[str, Any]:
     # Handle both dict (from list_analyses) and EmailAnalysis object
     if isinstance(record, dict):
-        return {
-            "id": record.get("id"),
-            "messageId": record.get("messageId"),
-            "provider": record.get("provider"),
-            "importance": record.get("importance"),
-            "categories": record.get("categories"),
-            "senderSummary": record.get("senderSummary"),
-            "senderValidated": record.get("senderValidated"),
-            "contentSummary": record.get("contentSummary"),
-            "extractedInfo": record.get("extractedInfo"),
-            "matchedNoteIds": record.get("matchedNoteIds"),
-            "createdNoteId": record.get("createdNoteId"),
-        }
-    else:
-        # EmailAnalysis object
-        return {
-            "id": f"{record.uid}_{record.provider}_{record.message_id}",
-            "messageId": record.message_id,
-            "provider": record.provider,
-            "importance": record.importance,
-            "categories": record.categories,
-            "senderSummary": record.sender_summary,
-            "senderValidated": record.sender_validated,
-            "contentSummary": record.content_summary,
-            "extractedInfo": record.extracted_info,
-            "matchedNoteIds": record.matched_note_ids,
-            "createdNoteId": record.created_note_id,
-        }
+        return _serialize_analysis_dict(record)
+    return _serialize_analysis_obj(record)
+
+
+# Bound client-supplied history limits so one request can't trigger an
+# unbounded collection read.
+_HISTORY_DEFAULT_LIMIT = 50
+_HISTORY_MAX_LIMIT = 200
 
 
 @analysis_bp.get("/history")
@@ -66,18 +79,44 @@ def get_history():
     auth_ctx = require_firebase_user()
 
     limit = request.args.get("limit")
-    limit_int: int | None
-    if limit is None:
-        limit_int = None
-    else:
-        try:
-            limit_int = int(limit)
-        except ValueError:
-            raise EmailAnalysisError("limit must be numeric")
+    try:
+        limit_int = int(limit) if limit is not None else _HISTORY_DEFAULT_LIMIT
+    except ValueError:
+        raise EmailAnalysisError("limit must be numeric")
+    limit_int = max(1, min(limit_int, _HISTORY_MAX_LIMIT))
 
-    analyses = list_analyses(auth_ctx.uid, limit=limit_int)
+    uid = auth_ctx.uid
 
-    return jsonify({"items": [_serialize_analysis(a) for a in analyses]}), HTTPStatus.OK
+    # Pull the first item before any response bytes are committed so a store
+    # error at query time still surfaces as a normal JSON error response
+    # instead of a truncated 200 body.
+    iterator = iter_analyses(uid, limit=limit_int)
+    try:
+        first_item = next(iterator)
+    except StopIteration:
+        first_item = None
+
+    def _stream():
+        # Encode items as they arrive from Firestore instead of materializing
+        # the whole list and one-shot encoding it. Once streaming has started
+        # the status line cannot change, so a store error mid-iteration closes
+        # the document with an "error" member rather than cutting it off.
+        yield b'{"items":['
+        if first_item is not None:
+            yield orjson.dumps(_serialize_analysis_dict(first_item))
+            try:
+                for analysis in iterator:
+                    yield b","
+                    yield orjson.dumps(_serialize_analysis_dict(analysis))
+            except EmailAnalysisError as exc:
+                yield b'],"error":' + orjson.dumps(exc.code)
+                yield b',"message":' + orjson.dumps(str(exc)) + b"}"
+                return
+        yield b"]}"
+
+    response = Response(stream_with_context(_stream()), mimetype="application/json")
+    response.headers["X-History-Max-Limit"] = str(_HISTORY_MAX_LIMIT)
+    return response, HTTPStatus.OK
 
 
 @analysis_bp.get("/<analysis_id>")
@@ -85,9 +124,23 @@ def get_history():
 def get_analysis_detail(analysis_id: str):
     """Get a specific email analysis."""
 
-    uid, provider, message_id = analysis_id.rsplit("_", 2)
+    auth_ctx = require_firebase_user()
+
+    try:
+        uid, provider, message_id = analysis_id.rsplit("_", 2)
+    except ValueError:
+        return (
+            jsonify({"error": "validation_error", "message": "analysis id must be uid_provider_messageId."}),
+            HTTPStatus.BAD_REQUEST,
+        )
+
+    # Reject foreign uids before spending a Firestore read on them.
+    if uid != auth_ctx.uid:
+        return (
+            jsonify({"error": "forbidden", "message": "You do not have access to this analysis."}),
+            HTTPStatus.FORBIDDEN,
+        )
 
-    from ..auth.utils import AuthContext
     try:
         analysis = get_analysis(uid, message_id, provider)
     except EmailAnalysisError as exc:
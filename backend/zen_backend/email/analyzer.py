@@ -8,6 +8,7 @@ import logging
 from datetime import datetime, timezone
 
 from firebase_admin import firestore as firebase_firestore
+from google.api_core import exceptions as google_exceptions
 from google.cloud.firestore_v1 import FieldFilter, Query
 
 from ..firebase import get_firestore_client
@@ -413,8 +414,12 @@ def get_user_categories(uid: str) -> dict[str, int]:
     return category_counts
 
 
-def list_analyses(uid: str, *, limit: int = 50) -> list[dict[str, Any]]:
-    """List email analyses for a user, ordered by most recent first."""
+def iter_analyses(uid: str, *, limit: int = 50):
+    """Lazily iterate a user's email analyses, most recent first.
+
+    Yields dicts as documents arrive so callers can overlap serialization
+    with the Firestore fetch.
+    """
 
     collection = _get_analysis_collection()
     query = collection.where(filter=FieldFilter("uid", "==", uid)).order_by(
@@ -425,8 +430,53 @@ def list_analyses(uid: str, *, limit: int = 50) -> list[dict[str, Any]]:
     if limit:
         query = query.limit(limit)
 
+    try:
+        for doc in query.stream():
+            data = doc.to_dict() or {}
+            data["id"] = f"{data.get('uid')}_{data.get('provider')}_{data.get('messageId')}"
+            yield data
+    except Exception as exc:
+        raise EmailAnalysisStoreError(f"Failed to list email analyses: {exc}") from exc
+
+
+def list_analyses(uid: str, *, limit: int = 50) -> list[dict[str, Any]]:
+    """List email analyses for a user, ordered by most recent first."""
+
+    return list(iter_analyses(uid, limit=limit))
+
+
+def list_high_importance_analyses(uid: str, *, threshold: int = 4, limit: int = 3) -> list[dict[str, Any]]:
+    """List a user's most recent analyses at or above an importance threshold.
+
+    Ordered by ``processedAt`` descending so new important emails are not
+    crowded out by old ones that happen to score higher. The Firestore-side
+    filter needs a composite index on (uid ASC, importance ASC, processedAt
+    DESC); if it is not deployed, the query falls back to the plain recency
+    index used by :func:`iter_analyses` and filters client-side.
+    """
+
+    collection = _get_analysis_collection()
+    query = (
+        collection.where(filter=FieldFilter("uid", "==", uid))
+        .where(filter=FieldFilter("importance", ">=", threshold))
+        .order_by("processedAt", direction=Query.DESCENDING)
+        .limit(limit)
+    )
+
     try:
         documents = list(query.stream())
+    except google_exceptions.FailedPrecondition:
+        log.warning(
+            "Composite index for high-importance analyses is missing; "
+            "falling back to client-side filtering for %s", uid
+        )
+        results = []
+        for data in iter_analyses(uid, limit=50):
+            if (data.get("importance") or 0) >= threshold:
+                results.append(data)
+                if len(results) >= limit:
+                    break
+        return results
     except Exception as exc:
         raise EmailAnalysisStoreError(f"Failed to list email analyses: {exc}") from exc
 
@@ -446,5 +496,7 @@ __all__ = [
     "analyze_email",
     "get_analysis",
     "get_user_categories",
+    "iter_analyses",
     "list_analyses",
+    "list_high_importance_analyses",
 ]
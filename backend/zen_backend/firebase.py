@@ -6,6 +6,8 @@ import json
 import os
 import logging
 
+import threading
+
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud import firestore as gcloud_firestore
@@ -14,6 +16,7 @@ log = logging.getLogger(__name__)
 
 firebase_app: Optional[firebase_admin.App] = None
 _firestore_client: Optional[firestore.Client] = None
+_firestore_client_lock = threading.Lock()
 _firestore_database_id: Optional[str] = None
 _firestore_project_id: Optional[str] = None
 
@@ -70,12 +73,24 @@ def init_firebase(credentials_path: Path, database_id: Optional[str] = None) ->
 
 
 def get_firestore_client() -> firestore.Client:
+    """Return the process-wide Firestore client.
+
+    One client is shared by all threads: its gRPC channel multiplexes
+    concurrent RPCs, so constructing extra clients only adds connection
+    setup cost. The lock keeps concurrent first calls from racing to
+    build duplicate clients.
+    """
     global _firestore_client
 
     if firebase_app is None:
         raise RuntimeError("Firebase app has not been initialised. Call init_firebase() first.")
 
-    if _firestore_client is None:
+    if _firestore_client is not None:
+        return _firestore_client
+
+    with _firestore_client_lock:
+        if _firestore_client is not None:
+            return _firestore_client
         if _firestore_database_id and _firestore_database_id not in {"(default)", "default", ""}:
             project_id = _firestore_project_id or getattr(firebase_app, "project_id", None)
             if not project_id:
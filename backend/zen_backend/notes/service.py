@@ -101,6 +101,31 @@ def serialize_note(document_id: str, data: dict[str, Any]) -> dict[str, Any]:
     return serialized
 
 
+def serialize_note_minimal(
+    document_id: str,
+    data: dict[str, Any],
+    *,
+    include_timestamps: bool = False,
+) -> dict[str, Any]:
+    """Serialize only the fields the AI tool handlers return.
+
+    Avoids building the full :func:`serialize_note` dict (with its legacy
+    aliases) just to immediately copy a subset out of it.
+    """
+
+    serialized = {
+        "id": document_id,
+        "title": data.get("title"),
+        "content": data.get("content") or "",
+        "keywords": data.get("keywords") or [],
+        "triggerWords": data.get("triggerWords") or [],
+    }
+    if include_timestamps:
+        serialized["createdAt"] = _to_iso(data.get("createdAt"))
+        serialized["updatedAt"] = _to_iso(data.get("updatedAt"))
+    return serialized
+
+
 def _ensure_ownership(data: dict[str, Any], uid: str, note_id: str) -> None:
     if data.get("uid") != uid:
         raise NotePermissionError(f"Note '{note_id}' does not belong to uid '{uid}'.")
@@ -430,6 +455,13 @@ def delete_note(
         log.warning("Failed to record note deletion history: %s", exc)
 
 
+def _normalize_search_result(data: dict[str, Any]) -> dict[str, Any]:
+    """Guarantee the projection keys consumers index into are present."""
+    data.setdefault("title", "")
+    data.setdefault("keywords", [])
+    return data
+
+
 def search_notes(
     uid: str,
     *,
@@ -489,7 +521,7 @@ def search_notes(
             
             # Sort by similarity (highest first) and return top results
             scored_results.sort(key=lambda x: x[0], reverse=True)
-            return [data for _, data in scored_results[:limit]]
+            return [_normalize_search_result(data) for _, data in scored_results[:limit]]
     
     # Fallback: use legacy keyword/trigger matching
     trigger_terms = normalize_string_list(trigger_terms, lowercase=True, max_items=10)
@@ -523,7 +555,7 @@ def search_notes(
                 continue
 
         data["id"] = doc.id
-        results.append(data)
+        results.append(_normalize_search_result(data))
         if len(results) >= limit:
             break
 